@@ -0,0 +1,236 @@
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from config import CHUNK_SIZE, METRICS_SUMMARY_FILE, MATCHES_SORT_ORDER, PLAYERS_SORT_ORDER
+from mock_riot_api import add_server_arguments, server_from_args, synthetic_match
+from profiler import StageProfiler
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+COLLECTOR_SCRIPT = os.path.join(BASE_DIR, "the_collector.py")
+RESULTS_DIR = os.path.join(BASE_DIR, "benchmarks")
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+TEMPLATE_MATCHES = 1000
+
+
+def run_collector_benchmark(args: argparse.Namespace) -> Dict:
+    with tempfile.TemporaryDirectory(prefix="collector-bench-") as data_dir, server_from_args(args) as api:
+        command = [sys.executable, COLLECTOR_SCRIPT, "--no-cache", "--data-dir", data_dir,
+                   "--api-url", api.url]
+        print(f"Crawling the mock API at {api.url}")
+        started = time.perf_counter()
+        with open(os.path.join(data_dir, "collector.log"), "w") as log:
+            completed = subprocess.run(command, cwd=data_dir, stdout=log, stderr=subprocess.STDOUT,
+                                       timeout=args.timeout)
+        wall = time.perf_counter() - started
+        if completed.returncode != 0:
+            with open(os.path.join(data_dir, "collector.log")) as log:
+                print(log.read()[-4000:])
+            raise RuntimeError(f"Collector exited with status {completed.returncode}")
+
+        with open(os.path.join(data_dir, METRICS_SUMMARY_FILE)) as f:
+            summary = json.load(f)
+        server_stats = dict(api.stats)
+
+    requests_sent = summary["requests"]
+    return {
+        "wall_s": wall,
+        "matches": summary["matches_stored"],
+        "matches_per_s": summary["matches_stored"] / wall if wall else None,
+        "requests": requests_sent,
+        "requests_per_s": requests_sent / wall if wall else None,
+        "responses_429": summary["responses_429"],
+        "rate_429": summary["responses_429"] / requests_sent if requests_sent else 0.0,
+        "responses_5xx": summary["responses_5xx"],
+        "retries": summary["retries"],
+        "sleep_s": sum(summary["sleep_s"].values()),
+        "sleep_s_by_reason": summary["sleep_s"],
+        "endpoints": {endpoint: {key: values[key] for key in ("requests", "mean_latency_s", "p95_latency_s")}
+                      for endpoint, values in summary["endpoints"].items()},
+        "server": server_stats,
+        "settings": {"app_limit": args.app_limit, "method_limits": args.method_limit,
+                     "players_per_page": args.players_per_page, "matches_per_player": args.matches_per_player,
+                     "match_pool": args.match_pool, "error_rate": args.error_rate, "slow_rate": args.slow_rate,
+                     "latency": args.latency},
+    }
+
+
+def run_processor_benchmark(sizes: List[int], chunk_size: int = CHUNK_SIZE, include_load: bool = False,
+                            trace_memory: bool = False) -> Dict:
+    # Imported here so the collector benchmark does not need pyarrow.
+    from columnar import MATCHES_SCHEMA, PLAYERS_SCHEMA, arrow_schema
+    from data_processor import DataLoader, DataWriter, MatchProcessor, ParquetChunkWriter
+
+    started = time.perf_counter()
+    template = [synthetic_match(game_number) for game_number in range(1, TEMPLATE_MATCHES + 1)]
+    print(f"Generated {len(template)} template matches in {time.perf_counter() - started:.1f}s")
+
+    def synthetic_chunk(first: int, count: int) -> List[Dict]:
+        # Shallow copies with fresh game IDs; participants are shared with the template.
+        return [dict(match, info=dict(match["info"], gameId=first + offset))
+                for offset, match in ((offset, template[(first + offset) % len(template)])
+                                      for offset in range(count))]
+
+    results = {}
+    for size in sizes:
+        profiler = StageProfiler(trace_memory=trace_memory)
+        processor = MatchProcessor(profiler)
+        match_rows = player_rows = 0
+        with tempfile.TemporaryDirectory(prefix="processor-bench-") as output_dir:
+            matches_file = os.path.join(output_dir, "matches.parquet")
+            players_file = os.path.join(output_dir, "players.parquet")
+            ndjson_file = os.path.join(output_dir, "matches.ndjson")
+            sink = io.StringIO()
+
+            def load_chunk(first: int, count: int) -> List[Dict]:
+                matches = synthetic_chunk(first, count)
+                if not include_load:
+                    return matches
+                # Serialized outside the timed stages, then parsed back like a collected NDJSON file.
+                with open(ndjson_file, "w") as f:
+                    f.writelines(json.dumps(match) + "\n" for match in matches)
+                del matches
+                return list(profiler.iterate("load", DataLoader.iter_ndjson(ndjson_file)))
+
+            # Small inputs go through process_matches and DataWriter in one go, like
+            # run_in_memory; larger ones are streamed chunk by chunk like run_streaming.
+            if size <= chunk_size:
+                mode = "in_memory"
+                matches = load_chunk(1, size)
+                with redirect_stdout(sink):
+                    matches_table, players_table = processor.process_matches(matches)
+                    with profiler.stage("write", matches_table.num_rows + players_table.num_rows):
+                        DataWriter.save_table(matches_table, matches_file, MATCHES_SORT_ORDER)
+                        DataWriter.save_table(players_table, players_file, PLAYERS_SORT_ORDER)
+                match_rows, player_rows = matches_table.num_rows, players_table.num_rows
+                del matches, matches_table, players_table
+            else:
+                mode = "streaming"
+                # Closed explicitly so writing the footers counts towards the write stage;
+                # the temporary directory cleans up after a failed run.
+                matches_writer = ParquetChunkWriter(matches_file, arrow_schema(MATCHES_SCHEMA), MATCHES_SORT_ORDER)
+                players_writer = ParquetChunkWriter(players_file, arrow_schema(PLAYERS_SCHEMA), PLAYERS_SORT_ORDER)
+                with redirect_stdout(sink):
+                    for first in range(1, size + 1, chunk_size):
+                        matches = load_chunk(first, min(chunk_size, size + 1 - first))
+                        matches_table, players_table = processor.process_matches(matches)
+                        with profiler.stage("write", matches_table.num_rows + players_table.num_rows):
+                            matches_writer.write_chunk(matches_table)
+                            players_writer.write_chunk(players_table)
+                        match_rows += matches_table.num_rows
+                        player_rows += players_table.num_rows
+                    with profiler.stage("write"):
+                        matches_writer.close()
+                        players_writer.close()
+
+            output_bytes = os.path.getsize(matches_file) + os.path.getsize(players_file)
+
+        profile = profiler.to_dict()
+        stages = profile["stages"]
+        load_s = stages["load"]["wall_s"] if "load" in stages else 0.0
+        process_s = sum(stages[name]["wall_s"] for name in ("extract_teams", "extract_players", "frame_build"))
+        write_s = stages["write"]["wall_s"]
+        total = load_s + process_s + write_s
+        results[str(size)] = {
+            "mode": mode,
+            "matches": size,
+            "load_s": load_s,
+            "process_s": process_s,
+            "write_s": write_s,
+            "total_s": total,
+            "matches_per_s": size / total if total else None,
+            "process_matches_per_s": size / process_s if process_s else None,
+            "write_rows_per_s": (match_rows + player_rows) / write_s if write_s else None,
+            "match_rows": match_rows,
+            "player_rows": player_rows,
+            "output_bytes": output_bytes,
+            "peak_rss_mb": profile["peak_rss_mb"],
+            "tracemalloc_peak_mb": profile["tracemalloc_peak_mb"],
+            "stages": stages,
+        }
+        load = f"load {load_s:.1f}s, " if include_load else ""
+        print(f"{size:>9} matches: {size / total:,.0f} matches/s "
+              f"({load}process {process_s:.1f}s, write {write_s:.1f}s, {output_bytes / (1024 * 1024):.1f}MB)")
+    return results
+
+
+def compare_results(current: Dict, baseline: Dict, tolerance: float, prefix: str = "") -> List[str]:
+    regressions = []
+    for key, value in current.items():
+        reference = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            regressions += compare_results(value, reference or {}, tolerance, f"{prefix}{key}.")
+        elif key.endswith("_per_s") and isinstance(value, (int, float)) and isinstance(reference, (int, float)):
+            if reference and value < reference * (1 - tolerance):
+                regressions.append(f"{prefix}{key}: {value:,.1f} vs {reference:,.1f} "
+                                   f"({(value / reference - 1) * 100:+.1f}%)")
+    return regressions
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the collector against a mock Riot API "
+                                                 "and the processor on synthetic matches")
+    parser.add_argument("suite", nargs="?", choices=["collector", "processor", "all"], default="all")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Match counts for the processor benchmark")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--include-load", action="store_true",
+                        help="Write each synthetic chunk as NDJSON and time parsing it back as the load stage")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Record the tracemalloc peak of each processor stage (slows the processor benchmark)")
+    parser.add_argument("--timeout", type=float, default=1800, help="Seconds before the collector run is aborted")
+    parser.add_argument("--output", help="Results file (default: benchmarks/benchmark-<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier results file to compare throughput against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Allowed throughput drop against the baseline before failing")
+    add_server_arguments(parser)
+    parser.set_defaults(app_limit="100:1,3000:60", players_per_page=20, match_pool=1000)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    started_at = datetime.now(timezone.utc)
+    results = {
+        "created_at": started_at.isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+    if args.suite in ("collector", "all"):
+        results["collector"] = run_collector_benchmark(args)
+        collector = results["collector"]
+        print(f"Collector: {collector['matches_per_s']:.1f} matches/s, {collector['requests_per_s']:.1f} requests/s, "
+              f"{collector['rate_429'] * 100:.2f}% 429s, {collector['sleep_s']:.1f}s sleeping")
+    if args.suite in ("processor", "all"):
+        results["processor"] = run_processor_benchmark(args.sizes, args.chunk_size, args.include_load,
+                                                       args.trace_memory)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"benchmark-{started_at.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_results(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No throughput regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
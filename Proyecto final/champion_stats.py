@@ -0,0 +1,352 @@
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from columnar import patch_from_version
+
+POSITIONS = ["TOP", "JUNGLE", "MIDDLE", "BOTTOM", "UTILITY"]
+UNKNOWN_POSITION = len(POSITIONS)
+TEAM_SIZE = 5
+COUNT_DTYPE = np.dtype("<u4")
+CHAMPION_GROWTH = 32
+BAN_COLUMNS = [f"ban{i}" for i in range(1, 6)]
+PLAYER_COLUMNS = ["gameId", "teamId", "championId", "teamPosition", "win"]
+
+# Axes of every count array. "position" has an extra slot for players without
+# a teamPosition; "lane" only covers the five real positions.
+COUNTS = {
+    "games": ("patch",),
+    "picks": ("patch", "position", "champion"),
+    "wins": ("patch", "position", "champion"),
+    "bans": ("patch", "champion"),
+    "ally_games": ("patch", "champion", "champion"),
+    "ally_wins": ("patch", "champion", "champion"),
+    "opponent_games": ("patch", "champion", "champion"),
+    "opponent_wins": ("patch", "champion", "champion"),
+    "lane_games": ("patch", "lane", "champion", "champion"),
+    "lane_wins": ("patch", "lane", "champion", "champion"),
+}
+PAIR_KINDS = ("ally", "opponent", "lane")
+
+
+class ChampionStats:
+    # Dense count arrays indexed by patch, position and a dense champion index
+    # (champion_ids[i] is the championId of index i). Pair arrays are read as
+    # [a, b]: games a played with (or against) b, and how many of those a won.
+
+    def __init__(self):
+        self.champion_ids: List[int] = []
+        self.champion_index: Dict[int, int] = {}
+        self.patches: List[str] = []
+        self.patch_index: Dict[str, int] = {}
+        self.runs: List[str] = []
+        self.capacity = 0
+        self.lookup = np.full(0, -1, dtype=np.int64)
+        self.counts = {name: np.zeros(self._shape(name), dtype=COUNT_DTYPE) for name in COUNTS}
+
+    def __len__(self) -> int:
+        return len(self.champion_ids)
+
+    def _shape(self, name: str) -> Tuple[int, ...]:
+        sizes = {"patch": len(self.patches), "position": len(POSITIONS) + 1, "lane": len(POSITIONS),
+                 "champion": self.capacity}
+        return tuple(sizes[axis] for axis in COUNTS[name])
+
+    def _resize(self) -> None:
+        for name, old in self.counts.items():
+            if old.shape == self._shape(name):
+                continue
+            grown = np.zeros(self._shape(name), dtype=COUNT_DTYPE)
+            grown[tuple(slice(0, size) for size in old.shape)] = old
+            self.counts[name] = grown
+
+    def champion_codes(self, champion_ids: np.ndarray) -> np.ndarray:
+        ids = np.asarray(champion_ids, dtype=np.int64)
+        valid = ids > 0
+        # New IDs get indices in order of first appearance, so load() restores the saved order.
+        unique, first = np.unique(ids[valid], return_index=True)
+        new_ids = [champion_id for champion_id in unique[np.argsort(first)].tolist()
+                   if champion_id not in self.champion_index]
+        if new_ids:
+            for champion_id in new_ids:
+                self.champion_index[champion_id] = len(self.champion_ids)
+                self.champion_ids.append(champion_id)
+            if len(self.champion_ids) > self.capacity:
+                self.capacity = -(-len(self.champion_ids) // CHAMPION_GROWTH) * CHAMPION_GROWTH
+                self._resize()
+            self.lookup = np.full(max(self.champion_ids) + 1, -1, dtype=np.int64)
+            self.lookup[self.champion_ids] = np.arange(len(self.champion_ids))
+
+        codes = np.full(len(ids), -1, dtype=np.int64)
+        codes[valid] = self.lookup[ids[valid]]
+        return codes
+
+    def patch_code(self, patch: str) -> int:
+        if patch not in self.patch_index:
+            self.patch_index[patch] = len(self.patches)
+            self.patches.append(patch)
+            self._resize()
+        return self.patch_index[patch]
+
+    def add_chunk(self, matches_table: pa.Table, players_table: pa.Table) -> None:
+        # Players are matched to their game's patch through the matches table of the same chunk.
+        game_ids, game_patches = self.add_matches(matches_table)
+        self.add_players(players_table, game_ids, game_patches)
+
+    def add_matches(self, matches_table: pa.Table) -> Tuple[np.ndarray, np.ndarray]:
+        if matches_table.num_rows == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        versions = pc.cast(matches_table.column("gameVersion"), pa.string()).combine_chunks().dictionary_encode()
+        version_patches = np.array([self.patch_code(patch_from_version(version))
+                                    for version in versions.dictionary.to_pylist()] or [0], dtype=np.int64)
+        unknown = self.patch_code(patch_from_version(None)) if versions.null_count else 0
+        patches = version_patches[pc.fill_null(versions.indices, 0).to_numpy()]
+        if versions.null_count:
+            patches[versions.is_null().to_numpy(zero_copy_only=False)] = unknown
+
+        game_column = pc.fill_null(matches_table.column("gameId"), -1).to_numpy()
+        game_ids, first_rows = np.unique(game_column, return_index=True)
+        game_patches = patches[first_rows]
+        self._add("games", (game_patches,))
+
+        for name in BAN_COLUMNS:
+            if name not in matches_table.column_names:
+                continue
+            champions = self.champion_codes(pc.fill_null(matches_table.column(name), -1).to_numpy())
+            banned = champions >= 0
+            self._add("bans", (patches[banned], champions[banned]))
+        return game_ids, game_patches
+
+    def add_players(self, players_table: pa.Table, game_ids: np.ndarray, game_patches: np.ndarray) -> None:
+        if players_table.num_rows == 0:
+            return
+
+        games = pc.fill_null(players_table.column("gameId"), -1).to_numpy()
+        rows = np.searchsorted(game_ids, games)
+        found = rows < len(game_ids)
+        found[found] = game_ids[rows[found]] == games[found]
+        patches = np.zeros(len(games), dtype=np.int64)
+        patches[found] = game_patches[rows[found]]
+        if not found.all():
+            patches[~found] = self.patch_code(patch_from_version(None))
+
+        champions = self.champion_codes(pc.fill_null(players_table.column("championId"), -1).to_numpy())
+        positions = pc.fill_null(pc.index_in(pc.cast(players_table.column("teamPosition"), pa.string()),
+                                             value_set=pa.array(POSITIONS)), UNKNOWN_POSITION).to_numpy()
+        teams = pc.fill_null(players_table.column("teamId"), -1).to_numpy()
+        wins = pc.fill_null(players_table.column("win"), False).to_numpy(zero_copy_only=False)
+
+        valid = champions >= 0
+        games, teams, patches, champions, positions, wins = (
+            values[valid] for values in (games, teams, patches, champions, positions, wins))
+        self._add("picks", (patches, positions, champions))
+        self._add("wins", (patches[wins], positions[wins], champions[wins]))
+        self._add_pairs(games, teams, patches, champions, positions, wins)
+
+    def _add_pairs(self, games: np.ndarray, teams: np.ndarray, patches: np.ndarray, champions: np.ndarray,
+                   positions: np.ndarray, wins: np.ndarray) -> None:
+        # Only complete 5v5 games are paired; they are reshaped to games x team x slot.
+        order = np.lexsort((positions, teams, games))
+        games, teams, patches, champions, positions, wins = (
+            values[order] for values in (games, teams, patches, champions, positions, wins))
+        _, starts, sizes = np.unique(games, return_index=True, return_counts=True)
+        starts = starts[sizes == 2 * TEAM_SIZE]
+        if len(starts) == 0:
+            return
+        rows = (starts[:, None] + np.arange(2 * TEAM_SIZE)).reshape(-1, 2, TEAM_SIZE)
+        team_ids = teams[rows]
+        complete = ((team_ids == team_ids[:, :, :1]).all(axis=(1, 2))
+                    & (team_ids[:, 0, 0] != team_ids[:, 1, 0]))
+        rows = rows[complete]
+        if len(rows) == 0:
+            return
+
+        champion = champions[rows]
+        position = positions[rows]
+        won = wins[rows[:, :, 0]]
+        patch = patches[rows[:, 0, 0]]
+
+        ally = [[], [], [], []]
+        for i in range(TEAM_SIZE):
+            for j in range(TEAM_SIZE):
+                if i == j:
+                    continue
+                ally[0].append(np.repeat(patch, 2))
+                ally[1].append(champion[:, :, i].ravel())
+                ally[2].append(champion[:, :, j].ravel())
+                ally[3].append(won.ravel())
+        self._add_pair_counts("ally", ally)
+
+        opponent = [[], [], [], []]
+        lane = [[], [], [], [], []]
+        for i in range(TEAM_SIZE):
+            for j in range(TEAM_SIZE):
+                for side in (0, 1):
+                    a, b = champion[:, side, i], champion[:, 1 - side, j]
+                    opponent[0].append(patch)
+                    opponent[1].append(a)
+                    opponent[2].append(b)
+                    opponent[3].append(won[:, side])
+                    same_lane = ((position[:, side, i] == position[:, 1 - side, j])
+                                 & (position[:, side, i] < UNKNOWN_POSITION))
+                    lane[0].append(patch[same_lane])
+                    lane[1].append(position[:, side, i][same_lane])
+                    lane[2].append(a[same_lane])
+                    lane[3].append(b[same_lane])
+                    lane[4].append(won[:, side][same_lane])
+        self._add_pair_counts("opponent", opponent)
+        self._add_pair_counts("lane", lane)
+
+    def _add_pair_counts(self, kind: str, columns: List[List[np.ndarray]]) -> None:
+        coordinates = [np.concatenate(values) for values in columns]
+        won = coordinates.pop()
+        self._add(f"{kind}_games", coordinates)
+        self._add(f"{kind}_wins", [values[won] for values in coordinates])
+
+    def _add(self, name: str, coordinates) -> None:
+        counts = self.counts[name]
+        if len(coordinates[0]) == 0:
+            return
+        cells, occurrences = np.unique(np.ravel_multi_index(coordinates, counts.shape), return_counts=True)
+        counts.reshape(-1)[cells] += occurrences.astype(COUNT_DTYPE)
+
+    def merge(self, other: "ChampionStats") -> None:
+        champion_map = self.champion_codes(np.array(other.champion_ids, dtype=np.int64))
+        patch_map = np.array([self.patch_code(patch) for patch in other.patches], dtype=np.int64)
+        maps = {"patch": patch_map, "position": np.arange(len(POSITIONS) + 1), "lane": np.arange(len(POSITIONS)),
+                "champion": champion_map}
+        for name, axes in COUNTS.items():
+            source = other.counts[name][tuple(slice(0, len(maps[axis])) for axis in axes)]
+            self.counts[name][np.ix_(*(maps[axis] for axis in axes))] += source
+
+    def _patch_rows(self, patch: Optional[str]):
+        if patch is None:
+            return slice(None)
+        return self.patch_index.get(patch, slice(0, 0))
+
+    def _sum(self, name: str, *index) -> int:
+        value = self.counts[name][index]
+        return int(value.sum()) if isinstance(value, np.ndarray) else int(value)
+
+    def champion(self, champion_id: int, patch: Optional[str] = None, position: Optional[str] = None) -> Dict:
+        rows = self._patch_rows(patch)
+        games = self._sum("games", rows)
+        stats = {"games": games, "picks": 0, "wins": 0, "bans": 0}
+        code = self.champion_index.get(champion_id)
+        if code is not None:
+            positions = slice(None) if position is None else POSITIONS.index(position)
+            stats.update(picks=self._sum("picks", rows, positions, code), wins=self._sum("wins", rows, positions, code),
+                         bans=self._sum("bans", rows, code))
+        stats["win_rate"] = stats["wins"] / stats["picks"] if stats["picks"] else None
+        stats["pick_rate"] = stats["picks"] / games if games else None
+        stats["ban_rate"] = stats["bans"] / games if games else None
+        return stats
+
+    def pair(self, champion_a: int, champion_b: int, kind: str = "ally", patch: Optional[str] = None,
+             position: Optional[str] = None) -> Tuple[int, int]:
+        # Games champion_a played with (ally) or against (opponent, lane) champion_b, and how many it won.
+        if kind not in PAIR_KINDS:
+            raise ValueError(f"Unknown pair kind {kind}, expected one of {PAIR_KINDS}")
+        a, b = self.champion_index.get(champion_a), self.champion_index.get(champion_b)
+        if a is None or b is None:
+            return 0, 0
+        index = [self._patch_rows(patch)]
+        if kind == "lane":
+            index.append(slice(None) if position is None else POSITIONS.index(position))
+        return self._sum(f"{kind}_games", *index, a, b), self._sum(f"{kind}_wins", *index, a, b)
+
+    def matrix(self, name: str, patch: Optional[str] = None) -> np.ndarray:
+        # Counts summed over patches (or for one patch), trimmed to the known champions.
+        counts = self.counts[name][self._patch_rows(patch)]
+        if patch is None or patch not in self.patch_index:
+            counts = counts.sum(axis=0, dtype=np.int64)
+        trim = tuple(slice(0, len(self.champion_ids)) if axis == "champion" else slice(None)
+                     for axis in COUNTS[name][1:])
+        return counts[trim]
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        size = len(self.champion_ids)
+        arrays = {name: counts[tuple(slice(0, size) if axis == "champion" else slice(None)
+                                     for axis in COUNTS[name])]
+                  for name, counts in self.counts.items()}
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez_compressed(f, champion_ids=np.array(self.champion_ids, dtype=np.int32),
+                                patches=np.array(self.patches, dtype=str), runs=np.array(self.runs, dtype=str),
+                                **arrays)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ChampionStats":
+        stats = cls()
+        if not os.path.exists(path):
+            return stats
+        with np.load(path, allow_pickle=False) as data:
+            stats.champion_codes(data["champion_ids"])
+            for patch in data["patches"].tolist():
+                stats.patch_code(patch)
+            stats.runs = data["runs"].tolist()
+            for name, axes in COUNTS.items():
+                saved = data[name]
+                stats.counts[name][tuple(slice(0, size) for size in saved.shape)] = saved
+        return stats
+
+    @classmethod
+    def from_dataset(cls, matches_dir: str, players_dir: str) -> "ChampionStats":
+        # Rebuilds the counts from the partitioned datasets, each game once.
+        stats = cls()
+        for matches_table, players_table in iter_dataset_games(matches_dir, players_dir,
+                                                               ["gameId", "gameVersion"] + BAN_COLUMNS,
+                                                               PLAYER_COLUMNS):
+            stats.add_chunk(matches_table, players_table)
+        return stats
+
+
+def iter_dataset_games(matches_dir: str, players_dir: str, match_columns: List[str],
+                       player_columns: List[str]) -> Iterator[Tuple[pa.Table, pa.Table]]:
+    # Whole games of the partitioned datasets: one players file at a time with the
+    # team rows of its games, then the games that have no players. A game that
+    # is stored more than once is only yielded the first time.
+    matches = ds.dataset(matches_dir, format="parquet", partitioning="hive")
+    match_columns = [name for name in match_columns if name in matches.schema.names]
+    matches_table = matches.to_table(columns=match_columns + [name for name in ["teamId"]
+                                                              if name not in match_columns])
+    games = pc.fill_null(matches_table.column("gameId"), -1).to_numpy()
+    teams = pc.fill_null(matches_table.column("teamId"), -1).to_numpy()
+    order = np.lexsort((teams, games))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (games[order][1:] != games[order][:-1]) | (teams[order][1:] != teams[order][:-1])
+    order = order[first]
+    matches_table = matches_table.take(order).select(match_columns)
+    games = games[order]
+    used = np.zeros(len(games), dtype=bool)
+    seen = set()
+
+    for file_path in ds.dataset(players_dir, format="parquet", partitioning="hive").files:
+        players_table = pq.read_table(file_path, columns=player_columns)
+        player_games = pc.fill_null(players_table.column("gameId"), -1).to_numpy()
+        file_games = np.unique(player_games)
+        new = np.fromiter((game not in seen for game in file_games.tolist()), dtype=bool, count=len(file_games))
+        if not new.all():
+            file_games = file_games[new]
+            players_table = players_table.filter(pa.array(np.isin(player_games, file_games)))
+        seen.update(file_games.tolist())
+
+        # Team rows are sorted by game, so each game's rows are one contiguous range.
+        start = np.searchsorted(games, file_games, "left")
+        sizes = np.searchsorted(games, file_games, "right") - start
+        rows = np.arange(sizes.sum()) + np.repeat(start - np.cumsum(sizes) + sizes, sizes)
+        used[rows] = True
+        yield matches_table.take(rows), players_table
+
+    left = np.flatnonzero(~used)
+    if len(left):
+        yield matches_table.take(left), pa.table({name: pa.array([], type=pa.int64()) for name in player_columns})
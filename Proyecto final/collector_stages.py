@@ -0,0 +1,446 @@
+import logging
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import (
+    CHECKPOINT_FREQ, LEAGUE_WORKERS, MATCH_ID_WORKERS, MATCH_WORKERS, PIPELINE_QUEUE_SIZE,
+    RETRY_WORKERS, RETRY_BATCH_SIZE, RETRY_MAX_UTILIZATION,
+    MATCH_IDS_INITIAL_COUNT, MATCH_IDS_PAGE_SIZE, MATCH_IDS_MAX_PAGES, MATCH_IDS_CURSOR_OVERLAP,
+    MATCH_IDS_MIN_EXPECTED_GAMES, MATCH_IDS_MAX_INTERVAL, MATCH_IDS_RATE_DAYS, MATCH_IDS_PRIOR_RATE,
+    PLATFORMS, PLATFORM_ROUTING, LEGACY_PLATFORM, QUEUES, TIERS, DIVISIONS
+)
+from pipeline import PipelineStage, feed_in_background
+from retry_scheduler import RetryScheduler, ERROR_PARSE, ERROR_UNKNOWN
+from riot_client import RiotClient, METHOD_MATCH, platform_of
+from state_store import CrawlState, PlayerCursor, STATUS_FAILED, STATUS_ABANDONED
+
+STAGE_NAMES = ["players", "match-ids", "matches"]
+BAR_FORMAT = "{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]"
+DAY = 24 * 60 * 60
+
+
+def expected_new_games(cursor: PlayerCursor, now: float) -> Optional[float]:
+    # None for players never crawled. The play rate starts from one day at
+    # MATCH_IDS_PRIOR_RATE, so crawls a few minutes apart can't make a player
+    # look inactive.
+    if cursor.crawled_at is None:
+        return None
+    rate = ((cursor.recent_games or 0.0) + MATCH_IDS_PRIOR_RATE) / ((cursor.recent_days or 0.0) + 1)
+    return rate * (now - cursor.crawled_at) / DAY
+
+
+def crawl_is_due(cursor: PlayerCursor, now: float) -> bool:
+    expected = expected_new_games(cursor, now)
+    return (expected is None or expected >= MATCH_IDS_MIN_EXPECTED_GAMES
+            or now - cursor.crawled_at >= MATCH_IDS_MAX_INTERVAL)
+
+
+def crawl_priority(cursor: PlayerCursor, now: float) -> Tuple[bool, float]:
+    # Players never crawled first, then the ones expected to have played the most.
+    expected = expected_new_games(cursor, now)
+    return expected is not None, -(expected or 0.0)
+
+
+def next_cursor(cursor: Optional[PlayerCursor], crawled_at: float, match_ids: List[str]
+                ) -> Tuple[Optional[str], Optional[float], Optional[float]]:
+    # Returns the newest match ID and the decayed (games, days) totals after a crawl.
+    if cursor is None or cursor.crawled_at is None:
+        return (match_ids[0] if match_ids else None), None, None
+
+    # Lists are newest first; the overlap with the last crawl starts at its newest match.
+    new_games = match_ids.index(cursor.newest_match_id) if cursor.newest_match_id in match_ids else len(match_ids)
+    days = max(0.0, crawled_at - cursor.crawled_at) / DAY
+    decay = math.exp(-days / MATCH_IDS_RATE_DAYS)
+    recent_games = (cursor.recent_games or 0.0) * decay + new_games
+    recent_days = (cursor.recent_days or 0.0) * decay + days
+    return (match_ids[0] if match_ids else cursor.newest_match_id), recent_games, recent_days
+
+
+class CrawlProgress:
+    # Progress bars plus the shared counters; the crawl state is committed
+    # every CHECKPOINT_FREQ handled items across all stages.
+
+    def __init__(self, state: CrawlState):
+        self.state = state
+        self.lock = threading.Lock()
+        self.bars = []
+        self.handled = 0
+        self.failed = 0
+
+    def new_bar(self, desc: str, unit: str, total: int = 0):
+        # tqdm is only imported once a stage actually starts.
+        from tqdm import tqdm
+        bar = tqdm(total=total, desc=desc, unit=unit, position=len(self.bars), bar_format=BAR_FORMAT)
+        self.bars.append(bar)
+        return bar
+
+    def grow(self, bar, added: int) -> None:
+        if added:
+            with self.lock:
+                bar.total += added
+                bar.refresh()
+
+    def advance(self, bar, failure: Optional[int] = None, **postfix) -> None:
+        with self.lock:
+            if failure is not None:
+                self.failed += failure
+                postfix["failed"] = self.failed
+            bar.update(1)
+            if postfix:
+                bar.set_postfix(**postfix)
+            self.handled += 1
+            if self.handled % CHECKPOINT_FREQ == 0:
+                self.state.commit()
+
+    def close(self) -> None:
+        for bar in self.bars:
+            bar.close()
+
+
+class CrawlContext:
+
+    def __init__(self, client: RiotClient, state: CrawlState, raw_store=None, timeline_store=None,
+                 platforms: List[str] = PLATFORMS):
+        self.client = client
+        self.state = state
+        self.raw_store = raw_store
+        self.timeline_store = timeline_store
+        self.platforms = list(platforms)
+        self.regions = sorted({PLATFORM_ROUTING[platform] for platform in self.platforms})
+        self.stop_event = threading.Event()
+        self.progress = CrawlProgress(state)
+
+
+class CollectorStage:
+    # One PipelineStage per platform or region. Whatever a stage discovers is
+    # submitted to the next stage when that stage runs too, and otherwise only
+    # recorded in the crawl state for a later run of the next stage.
+
+    name = "stage"
+    workers = 1
+
+    def __init__(self, context: CrawlContext, keys: Iterable[str], queue_size: int = PIPELINE_QUEUE_SIZE):
+        self.context = context
+        self.state = context.state
+        self.client = context.client
+        self.progress = context.progress
+        self.keys = list(keys)
+        self.queue_size = queue_size
+        self.pipelines: Dict[str, PipelineStage] = {}
+        self.feeders: List[threading.Thread] = []
+        self.bar = None
+
+    def handler(self, key: str) -> Callable:
+        raise NotImplementedError
+
+    def new_bar(self):
+        raise NotImplementedError
+
+    def seed(self) -> None:
+        # Queues the work already known when the stage starts.
+        pass
+
+    def start(self) -> "CollectorStage":
+        self.bar = self.new_bar()
+        self.pipelines = {key: PipelineStage(f"{self.name}-{key}", self.handler(key), self.workers, self.queue_size,
+                                             self.context.stop_event).start() for key in self.keys}
+        return self
+
+    def submit(self, key: str, items: List) -> bool:
+        self.progress.grow(self.bar, len(items))
+        return self.pipelines[key].feed(items)
+
+    def submit_in_background(self, key: str, items: List) -> None:
+        self.progress.grow(self.bar, len(items))
+        self.feeders.append(feed_in_background(self.pipelines[key], items))
+
+    def backlog(self, key: str) -> int:
+        return self.pipelines[key].backlog()
+
+    def close(self) -> None:
+        # Only called once every upstream stage is closed.
+        for feeder in self.feeders:
+            feeder.join()
+        for pipeline in self.pipelines.values():
+            pipeline.close()
+
+    def join(self) -> None:
+        for pipeline in self.pipelines.values():
+            pipeline.join()
+
+
+class PlayersStage(CollectorStage):
+    name = "league"
+    workers = LEAGUE_WORKERS
+
+    def __init__(self, context: CrawlContext, next_stage: Optional["MatchIdsStage"] = None):
+        self.combos = [(q, t, d) for q in QUEUES for t in TIERS for d in DIVISIONS]
+        super().__init__(context, context.platforms, len(self.combos) or 1)
+        self.next_stage = next_stage
+
+    def new_bar(self):
+        return self.progress.new_bar("League entries", "combo")
+
+    def seed(self) -> None:
+        for platform in self.keys:
+            self.submit_in_background(platform, self.combos)
+
+    def handler(self, platform: str) -> Callable:
+        region = PLATFORM_ROUTING[platform]
+
+        def handle_league_entries(combo):
+            queue, tier, division = combo
+            page = 1
+            # Pages are walked until one comes back empty.
+            while not self.context.stop_event.is_set():
+                resp = self.client.league_entries(platform, queue, tier, division, page)
+                if not resp:
+                    logging.warning(f"Failed to fetch {platform} {tier} {division} page {page}, continuing to next")
+                    break
+                try:
+                    entries = resp.json()
+                    new_players = self.state.add_players((p["puuid"] for p in entries if "puuid" in p), platform)
+                except (ValueError, KeyError, TypeError) as e:
+                    logging.error(f"Error parsing response: {str(e)}")
+                    break
+                if not entries:
+                    break
+
+                if self.next_stage is not None:
+                    self.next_stage.submit(region, new_players)
+                page += 1
+
+            self.progress.advance(self.bar, players=self.state.player_count())
+
+        return handle_league_entries
+
+
+class MatchIdsStage(CollectorStage):
+    name = "match-ids"
+    workers = MATCH_ID_WORKERS
+
+    def __init__(self, context: CrawlContext, next_stage: Optional["MatchesStage"] = None):
+        super().__init__(context, context.regions)
+        self.next_stage = next_stage
+
+    def new_bar(self):
+        return self.progress.new_bar("Match IDs", "player")
+
+    def seed(self) -> None:
+        # Known players are only crawled once their play rate says they likely have new games.
+        now = time.time()
+        due_players = {region: [] for region in self.keys}
+        skipped = 0
+        for cursor in self.state.player_cursors():
+            region = PLATFORM_ROUTING.get(cursor.platform or LEGACY_PLATFORM)
+            if region not in due_players:
+                continue
+            if crawl_is_due(cursor, now):
+                due_players[region].append(cursor)
+            else:
+                skipped += 1
+        if skipped:
+            logging.info(f"Skipping {skipped} players that are unlikely to have played since their last crawl")
+        for region, cursors in due_players.items():
+            cursors.sort(key=lambda cursor: crawl_priority(cursor, now))
+            self.submit_in_background(region, [cursor.puuid for cursor in cursors])
+
+    def fetch_match_ids(self, region: str, puuid: str, cursor: Optional[PlayerCursor]) -> Optional[List[str]]:
+        # None if a request failed; the player's cursor then stays where it was.
+        if cursor is None or cursor.crawled_at is None:
+            return self.parse_match_ids(puuid, self.client.match_ids(region, puuid, count=MATCH_IDS_INITIAL_COUNT))
+
+        start_time = int(cursor.crawled_at - MATCH_IDS_CURSOR_OVERLAP)
+        match_ids = []
+        for page in range(MATCH_IDS_MAX_PAGES):
+            page_ids = self.parse_match_ids(puuid, self.client.match_ids(
+                region, puuid, start=page * MATCH_IDS_PAGE_SIZE, count=MATCH_IDS_PAGE_SIZE, start_time=start_time))
+            if page_ids is None:
+                return None
+            match_ids.extend(page_ids)
+            # Only a player with a backlog fills a page, and paging stops at the newest match already seen.
+            if len(page_ids) < MATCH_IDS_PAGE_SIZE or cursor.newest_match_id in page_ids:
+                break
+        return match_ids
+
+    @staticmethod
+    def parse_match_ids(puuid: str, resp) -> Optional[List[str]]:
+        if not resp:
+            return None
+        try:
+            match_ids = resp.json()
+        except ValueError as e:
+            logging.error(f"Error parsing matches for puuid {puuid}: {str(e)}")
+            return None
+        if not isinstance(match_ids, list):
+            logging.error(f"Error parsing matches for puuid {puuid}: expected a list, got {type(match_ids)}")
+            return None
+        return match_ids
+
+    def handler(self, region: str) -> Callable:
+        raw_store = self.context.raw_store
+
+        def handle_player(puuid):
+            cursor = self.state.player_cursor(puuid)
+            crawled_at = time.time()
+            match_ids = self.fetch_match_ids(region, puuid, cursor)
+            new_matches = []
+            if match_ids is not None:
+                new_matches = self.state.add_match_ids(match_ids, region)
+                if cursor is not None and not self.context.stop_event.is_set():
+                    self.state.update_player_cursor(puuid, crawled_at, *next_cursor(cursor, crawled_at, match_ids))
+
+            if raw_store is not None:
+                self.state.mark_fetched(match_id for match_id in new_matches if match_id in raw_store)
+                new_matches = [match_id for match_id in new_matches if match_id not in raw_store]
+            backlog = self.next_stage.backlog(region) if self.next_stage is not None else 0
+            self.progress.advance(self.bar, new_matches=len(new_matches), backlog=backlog)
+            if self.next_stage is not None:
+                self.next_stage.submit(region, new_matches)
+
+        return handle_player
+
+
+class MatchesStage(CollectorStage):
+    name = "matches"
+    workers = MATCH_WORKERS
+
+    def __init__(self, context: CrawlContext):
+        super().__init__(context, context.regions)
+        self.retry_pipelines: Dict[str, PipelineStage] = {}
+        self.retries_bar = None
+        self.retries = RetryScheduler(self.state, self.keys, self.submit_retry, self.has_spare_budget)
+
+    def new_bar(self):
+        return self.progress.new_bar("Match data", "match")
+
+    def start(self) -> "MatchesStage":
+        match_counts = self.state.match_counts()
+        self.progress.failed = match_counts.get(STATUS_FAILED, 0) + match_counts.get(STATUS_ABANDONED, 0)
+        super().start()
+        self.retries_bar = self.progress.new_bar("Retries", "match")
+        self.retry_pipelines = {region: PipelineStage(f"retries-{region}", self.handler(region, retry=True),
+                                                      RETRY_WORKERS, RETRY_BATCH_SIZE,
+                                                      self.context.stop_event).start() for region in self.keys}
+        self.retries.start()
+        return self
+
+    def seed(self) -> None:
+        raw_store = self.context.raw_store
+        pending_matches = {region: [] for region in self.keys}
+        already_stored = []
+        for match_id, region in self.state.pending_matches():
+            region = region or PLATFORM_ROUTING[platform_of(match_id, LEGACY_PLATFORM)]
+            if match_id in raw_store:
+                already_stored.append(match_id)
+            elif region in pending_matches:
+                pending_matches[region].append(match_id)
+        self.state.mark_fetched(already_stored)
+        self.state.commit()
+        for region, match_ids in pending_matches.items():
+            self.submit_in_background(region, match_ids)
+
+    def submit_retry(self, region: str, match_id: str) -> bool:
+        self.progress.grow(self.retries_bar, 1)
+        return self.retry_pipelines[region].put(match_id)
+
+    def has_spare_budget(self, region: str) -> bool:
+        # Retries only use what the main crawl leaves of the match endpoint's budget.
+        limiter = self.client.limiter_for(region)
+        return self.backlog(region) == 0 and limiter.utilization(METHOD_MATCH) < RETRY_MAX_UTILIZATION
+
+    def handler(self, region: str, retry: bool = False) -> Callable:
+        bar = self.retries_bar if retry else self.bar
+        raw_store = self.context.raw_store
+        timeline_store = self.context.timeline_store
+
+        def handle_match(match_id):
+            resp = self.client.match(region, match_id)
+            if resp and timeline_store is not None and match_id not in timeline_store:
+                self.fetch_timeline(region, match_id)
+
+            failed = False
+            if not resp and self.client.offline:
+                logging.debug(f"Match {match_id} is not in the response cache, leaving it as it is")
+                failed = retry
+            elif not resp:
+                error_class = getattr(resp, "error_class", ERROR_UNKNOWN)
+                logging.warning(f"Failed to fetch match {match_id} ({error_class}), marking it as failed")
+                self.retries.record_failure(match_id, error_class, getattr(resp, "message", "request failed"))
+                failed = True
+            else:
+                try:
+                    self.client.metrics.record_match(raw_store.append(match_id, resp.json()))
+                    self.state.mark_fetched([match_id])
+                    self.retries.record_success(match_id)
+                except (ValueError, KeyError) as e:
+                    logging.error(f"Error parsing match data for {match_id}: {str(e)}")
+                    self.retries.record_failure(match_id, ERROR_PARSE, f"parse error: {e}")
+                    failed = True
+
+            # A retry that fails again was already counted as failed.
+            self.progress.advance(bar, int(failed) - int(retry), matches=len(raw_store),
+                                  size_mb=f"{raw_store.size_bytes / (1024 * 1024):.1f}MB")
+
+        return handle_match
+
+    def fetch_timeline(self, region: str, match_id: str) -> None:
+        resp = self.client.timeline(region, match_id)
+        if not resp:
+            logging.warning(f"Failed to fetch timeline for {match_id}, the match is kept without it")
+            return
+        try:
+            self.context.timeline_store.append(match_id, resp.json())
+        except (ValueError, KeyError, TypeError, OverflowError) as e:
+            logging.error(f"Error storing timeline for {match_id}: {str(e)}")
+
+    def close(self) -> None:
+        super().close()
+        # With the main crawl done the whole budget is spare, so every retry due by now goes out.
+        self.retries.stop()
+        self.retries.schedule_due(only_spare=False)
+        for pipeline in self.retry_pipelines.values():
+            pipeline.close()
+        if self.retries.retried or self.retries.recovered:
+            logging.info(f"Retried {self.retries.retried + self.retries.recovered} failed matches, "
+                         f"{self.retries.recovered} recovered")
+        failures = self.state.failure_counts()
+        if failures:
+            logging.info(f"Unfetched matches by error class: {failures}")
+
+    def join(self) -> None:
+        self.retries.stop()
+        super().join()
+        for pipeline in self.retry_pipelines.values():
+            pipeline.join()
+
+
+def build_stages(context: CrawlContext, names: Iterable[str]) -> List[CollectorStage]:
+    names = set(names)
+    matches = MatchesStage(context) if "matches" in names else None
+    match_ids = MatchIdsStage(context, matches) if "match-ids" in names else None
+    players = PlayersStage(context, match_ids) if "players" in names else None
+    return [stage for stage in (players, match_ids, matches) if stage is not None]
+
+
+def run_stages(context: CrawlContext, stages: List[CollectorStage]) -> None:
+    # Every stage runs at once and each region has its own pipelines: new PUUIDs
+    # go straight to match ID discovery and new match IDs straight to the match
+    # fetchers of the same region. Stages are closed upstream first.
+    try:
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            stage.seed()
+        for stage in stages:
+            stage.close()
+    except KeyboardInterrupt:
+        context.stop_event.set()
+        for stage in stages:
+            stage.join()
+        raise
+    finally:
+        context.progress.close()
+        context.state.commit()
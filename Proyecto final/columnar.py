@@ -0,0 +1,160 @@
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+
+from config import MATCHES_COLUMNS, PLAYERS_COLUMNS
+
+INITIAL_CAPACITY = 1024
+UNKNOWN_PARTITION = "unknown"
+
+ARROW_TYPES = {
+    "bool": pa.bool_(),
+    "int16": pa.int16(),
+    "int32": pa.int32(),
+    "int64": pa.int64(),
+    "string": pa.string(),
+    "dictionary": pa.dictionary(pa.int32(), pa.string()),
+}
+
+OBJECTIVES = ["atakhan", "baron", "champion", "dragon", "horde", "inhibitor", "riftHerald", "tower"]
+
+MATCHES_TYPES = {
+    "gameId": "int64",
+    "teamId": "int16",
+    "win": "bool",
+    "gameDuration": "int32",
+    "gameCreation": "int64",
+    "gameVersion": "dictionary",
+    "platformId": "dictionary",
+    **{f"ban{i}": "int16" for i in range(1, 6)},
+    **{f"{objective}First": "bool" for objective in OBJECTIVES},
+    **{f"{objective}Kills": "int16" for objective in OBJECTIVES},
+}
+
+PLAYERS_TYPES = {
+    "gameId": "int64",
+    "championName": "dictionary",
+    "teamPosition": "dictionary",
+    "individualPosition": "dictionary",
+    "lane": "dictionary",
+    "role": "dictionary",
+    "puuid": "dictionary",
+    "riotIdGameName": "string",
+    "riotIdTagline": "string",
+    "summonerId": "string",
+    "summonerName": "string",
+    **{name: "bool" for name in [
+        "eligibleForProgression", "firstBloodAssist", "firstBloodKill", "firstTowerAssist",
+        "firstTowerKill", "gameEndedInEarlySurrender", "gameEndedInSurrender",
+        "teamEarlySurrendered", "win",
+    ]},
+    **{name: "int16" for name in [
+        "assists", "baronKills", "bountyLevel", "champLevel", "championId", "championTransform",
+        "consumablesPurchased", "deaths", "detectorWardsPlaced", "doubleKills", "dragonKills",
+        "inhibitorKills", "inhibitorTakedowns", "inhibitorsLost", "itemsPurchased", "killingSprees",
+        "kills", "largestKillingSpree", "largestMultiKill", "nexusKills", "nexusLost", "nexusTakedowns",
+        "objectivesStolen", "objectivesStolenAssists", "participantId", "pentaKills", "placement",
+        "playerSubteamId", "quadraKills", "sightWardsBoughtInGame", "subteamPlacement", "summoner1Id",
+        "summoner2Id", "summonerLevel", "teamId", "tripleKills", "turretKills", "turretTakedowns",
+        "turretsLost", "unrealKills", "visionWardsBoughtInGame", "wardsKilled", "wardsPlaced",
+    ]},
+    **{name: "int16" for name in PLAYERS_COLUMNS if name.endswith("Pings")},
+}
+
+
+def patch_from_version(version: Optional[str]) -> str:
+    if not version:
+        return UNKNOWN_PARTITION
+    return ".".join(str(version).split(".")[:2])
+
+
+def column_types(columns: List[str], types: Dict[str, str], default: str = "int32") -> Dict[str, str]:
+    return {name: types.get(name, default) for name in columns}
+
+
+def arrow_schema(column_kinds: Dict[str, str]) -> pa.Schema:
+    return pa.schema([pa.field(name, ARROW_TYPES[kind]) for name, kind in column_kinds.items()])
+
+
+class ColumnBuffer:
+    
+    def __init__(self, kind: str, capacity: int):
+        self.kind = kind
+        self.arrow_type = ARROW_TYPES[kind]
+        self.values: List = [None] * capacity
+    
+    def grow(self, capacity: int) -> None:
+        self.values.extend([None] * (capacity - len(self.values)))
+    
+    def to_arrow(self, length: int) -> pa.Array:
+        values = self.values[:length]
+        value_type = pa.string() if self.kind == "dictionary" else self.arrow_type
+        try:
+            array = pa.array(values, type=value_type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError, TypeError):
+            array = pa.array([self._coerce(value) for value in values], type=value_type)
+        return array.dictionary_encode() if self.kind == "dictionary" else array
+    
+    def _coerce(self, value):
+        if value is None:
+            return None
+        if self.kind in ("string", "dictionary"):
+            return value if isinstance(value, str) else str(value)
+        try:
+            pa.array([value], type=self.arrow_type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError, TypeError):
+            return None
+        return value
+
+
+class ColumnarBatch:
+    # Values are written by column name into preallocated per-column buffers and
+    # only converted to typed Arrow arrays once per batch; anything that cannot
+    # be represented in the column's type ends up as a null.
+    
+    def __init__(self, column_kinds: Dict[str, str], capacity: int = INITIAL_CAPACITY):
+        self.column_kinds = column_kinds
+        self.schema = arrow_schema(column_kinds)
+        self.capacity = max(1, capacity)
+        self.buffers = {name: ColumnBuffer(kind, self.capacity) for name, kind in column_kinds.items()}
+        self.size = 0
+    
+    def __len__(self) -> int:
+        return self.size
+    
+    def new_row(self) -> int:
+        if self.size == self.capacity:
+            self.capacity *= 2
+            for buffer in self.buffers.values():
+                buffer.grow(self.capacity)
+        row = self.size
+        self.size += 1
+        return row
+    
+    def discard_row(self, row: int) -> None:
+        if row != self.size - 1:
+            raise ValueError("Only the most recently added row can be discarded")
+        for buffer in self.buffers.values():
+            buffer.values[row] = None
+        self.size -= 1
+    
+    def set(self, row: int, name: str, value) -> None:
+        buffer = self.buffers.get(name)
+        if buffer is not None:
+            buffer.values[row] = value
+    
+    def column_values(self, fields: List[str]) -> List[List]:
+        return [self.buffers[name].values for name in fields]
+    
+    def set_fields(self, row: int, record: Dict, fields: List[str], columns: Optional[List[List]] = None) -> None:
+        get = record.get
+        for values, name in zip(columns if columns is not None else self.column_values(fields), fields):
+            values[row] = get(name)
+    
+    def to_arrow(self) -> pa.Table:
+        arrays = [buffer.to_arrow(self.size) for buffer in self.buffers.values()]
+        return pa.Table.from_arrays(arrays, schema=self.schema)
+
+
+MATCHES_SCHEMA = column_types(MATCHES_COLUMNS, MATCHES_TYPES)
+PLAYERS_SCHEMA = column_types(PLAYERS_COLUMNS, PLAYERS_TYPES)
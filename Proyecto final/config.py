@@ -1,22 +1,69 @@
 INPUT_FILE = "matches_data.json"
 PLAYERS_OUTPUT = "players_data.parquet"
 MATCHES_OUTPUT = "matches_data.parquet"
+CHAMPION_STATS_FILE = "champion_stats.npz"
 
 # Collector configuration
 API_KEY = "RGAPI-XXXXX-XXXX-XXXX-XXXX-XXXXXXX"  # Replace with your actual API key
 THRESHOLD = 1
-PAUSE_BETW = 0.25
 CHECKPOINT_FREQ = 25
 MAX_RETRIES = 5
 BASE_TIMEOUT = 10
+MAX_WORKERS = 8
+LEAGUE_WORKERS = 2
+MATCH_ID_WORKERS = 4
+MATCH_WORKERS = MAX_WORKERS
+PIPELINE_QUEUE_SIZE = 1000  # Items waiting per stage before the stage feeding it blocks
+RETRY_WORKERS = 1
+RETRY_BASE_DELAY = 5 * 60  # Seconds before a failed match is tried again, doubled per attempt
+RETRY_MAX_DELAY = 6 * 60 * 60
+MAX_MATCH_ATTEMPTS = 8  # Matches still failing after this many attempts are abandoned
+RETRY_POLL_INTERVAL = 5
+RETRY_BATCH_SIZE = 20
+RETRY_MAX_UTILIZATION = 0.5  # Retries are only scheduled while the rate limit is less used than this
+DEFAULT_APP_RATE_LIMIT = "20:1,100:120"  # Development key limits, used until the first response headers arrive
+MATCH_IDS_INITIAL_COUNT = 20  # Most recent match IDs asked for on a player's first crawl
+MATCH_IDS_PAGE_SIZE = 100  # Later crawls only ask for games since the last one, paging while pages come back full
+MATCH_IDS_MAX_PAGES = 10
+MATCH_IDS_CURSOR_OVERLAP = 60 * 60  # Seconds before the last crawl to ask from, so games in progress aren't missed
+MATCH_IDS_MIN_EXPECTED_GAMES = 1.0  # Players are re-crawled once their play rate predicts this many new games
+MATCH_IDS_MAX_INTERVAL = 7 * 24 * 60 * 60  # ... or when their last crawl is this old, whatever their play rate
+MATCH_IDS_RATE_DAYS = 14  # Time constant of the play rate average; older crawls weigh exponentially less
+MATCH_IDS_PRIOR_RATE = 1.0  # Games per day assumed for a player until their crawls cover more than a day
 
 # File paths for collector
 PLAYERS_FILE = "players_puuids.json"
 GAMES_FILE = "latest_games.json"
 TIMELINE_FILE = "matches_timeline.json"
 FAILED_MATCHES_FILE = "failed_matches.json"
+STATE_DB_FILE = "crawl_state.db"
+RAW_STORE_DIR = "raw_matches"
+METRICS_FILE = "collector_metrics.prom"
+METRICS_SUMMARY_FILE = "collector_metrics.json"
+METRICS_INTERVAL = 15
+SEGMENT_MAX_BYTES = 256 * 1024 * 1024
+TIMELINE_STORE_DIR = "timelines"
+CACHE_DIR = "http_cache"
+CACHE_MAX_BYTES = 20 * 1024 * 1024 * 1024
+# Seconds a cached response stays fresh per endpoint; None never expires, endpoints not listed are not cached
+CACHE_TTL_SECONDS = {
+    "league-exp-v4.getLeagueEntries": 6 * 60 * 60,
+    "match-v5.getMatchIdsByPUUID": 60 * 60,
+    "match-v5.getMatch": None,
+    "match-v5.getTimeline": None,
+}
+FETCH_TIMELINES = False  # Timelines cost one extra request per match
 
 # API configuration
+API_URL = "https://{route}.api.riotgames.com"  # {route} is a platform (kr) or a regional routing value (asia)
+PLATFORMS = ['kr']
+LEGACY_PLATFORM = 'kr'  # Platform of players and matches collected before platforms were tracked
+PLATFORM_ROUTING = {
+    'br1': 'americas', 'la1': 'americas', 'la2': 'americas', 'na1': 'americas',
+    'eun1': 'europe', 'euw1': 'europe', 'me1': 'europe', 'ru': 'europe', 'tr1': 'europe',
+    'jp1': 'asia', 'kr': 'asia',
+    'oc1': 'sea', 'ph2': 'sea', 'sg2': 'sea', 'th2': 'sea', 'tw2': 'sea', 'vn2': 'sea',
+}
 QUEUES = ['RANKED_SOLO_5x5']
 TIERS = ['MASTER', 'GRANDMASTER', 'CHALLENGER']
 DIVISIONS = ['I', 'II', 'III', 'IV']
@@ -30,7 +77,8 @@ UNWANTED_STATS = [
 ]
 
 MATCHES_COLUMNS = [
-    'gameId', 'teamId', 'win', 'gameDuration', 'ban1', 'ban2', 'ban3', 'ban4', 'ban5', 
+    'gameId', 'teamId', 'win', 'gameDuration', 'gameCreation', 'gameVersion', 'platformId',
+    'ban1', 'ban2', 'ban3', 'ban4', 'ban5', 
     'atakhanFirst', 'atakhanKills', 'baronFirst', 'baronKills', 'championFirst', 
     'championKills', 'dragonFirst', 'dragonKills', 'hordeFirst', 'hordeKills', 
     'inhibitorFirst', 'inhibitorKills', 'riftHeraldFirst', 'riftHeraldKills', 
@@ -75,4 +123,22 @@ PLAYERS_COLUMNS = [
 BATCH_SIZE = 100
 LARGE_FILE_THRESHOLD = 100 * 1024 * 1024
 CHUNK_SIZE = 10000
+PROFILE_OUTPUT = "processor_profile.json"
+PARQUET_COMPRESSION = "zstd"
+ROW_GROUP_SIZE = 64 * 1024  # Rows per Parquet row group; smaller groups let filters skip more data
+# Rows are sorted in this order before they are written, so each row group's min/max statistics cover a narrow range
+MATCHES_SORT_ORDER = [('gameId', 'ascending'), ('teamId', 'ascending')]
+PLAYERS_SORT_ORDER = [('championId', 'ascending'), ('gameId', 'ascending')]
+READ_BATCH_SIZE = 64 * 1024
+PARTITION_COLUMNS = ['region', 'patch', 'date']
+
+# Training matrices exported by data_processor.py --export-training
+TRAINING_EXPORT_DIR = "training_data"
+TRAINING_CHAMPION_SLOTS = 1024  # Columns per one-hot block; the championId is the column within its block
+# Player stats summed per team, and team objective columns, for the dense aggregates
+TRAINING_PLAYER_AGGREGATES = [
+    'kills', 'deaths', 'assists', 'goldEarned', 'totalDamageDealtToChampions', 'damageDealtToObjectives',
+    'totalMinionsKilled', 'neutralMinionsKilled', 'visionScore', 'wardsPlaced', 'champLevel'
+]
+TRAINING_TEAM_COLUMNS = [name for name in MATCHES_COLUMNS if name.endswith(('First', 'Kills'))]
 
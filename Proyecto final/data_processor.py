@@ -1,13 +1,41 @@
+import argparse
+import functools
 import json
-import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import operator
 import os
+import shutil
 import sys
-from typing import Dict, List, Any, Tuple, Optional
+import time
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Tuple, Optional, Iterable, Iterator, Set
 
 from config import (
-    INPUT_FILE, PLAYERS_OUTPUT, MATCHES_OUTPUT,
-    UNWANTED_STATS, MATCHES_COLUMNS, PLAYERS_COLUMNS
+    INPUT_FILE, PLAYERS_OUTPUT, MATCHES_OUTPUT, UNWANTED_STATS,
+    LARGE_FILE_THRESHOLD, CHUNK_SIZE, PARQUET_COMPRESSION, PARTITION_COLUMNS, PLATFORM_ROUTING,
+    CHAMPION_STATS_FILE, ROW_GROUP_SIZE, MATCHES_SORT_ORDER, PLAYERS_SORT_ORDER, READ_BATCH_SIZE, PROFILE_OUTPUT,
+    TRAINING_EXPORT_DIR
 )
+from champion_stats import ChampionStats
+from columnar import (
+    ColumnarBatch, MATCHES_SCHEMA, PLAYERS_SCHEMA, UNKNOWN_PARTITION, arrow_schema, patch_from_version
+)
+from profiler import StageProfiler, profile_calls
+from raw_store import RawMatchStore, read_entries, read_index
+from training_export import TrainingExporter, export_dataset, prepare_export_dir, read_manifest, write_manifest
+
+READ_BUFFER_SIZE = 1024 * 1024
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl")
+GAME_INFO_FIELDS = ('gameCreation', 'gameVersion', 'platformId')
+MANIFEST_FILE = "_manifest.json"
+GAME_IDS_FILE = "_game_ids.i64"
+GAME_ID_DTYPE = np.dtype("<i8")
+LEGACY_PARTITION_COLUMNS = ['patch', 'date']  # Datasets whose manifest predates region partitions
 
 
 class DataLoader:
@@ -17,8 +45,11 @@ class DataLoader:
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"The file {file_path} does not exist")
         
-        with open(file_path) as f:
-            matches_data = json.load(f)
+        if file_path.endswith(NDJSON_EXTENSIONS):
+            matches_data = list(DataLoader.iter_ndjson(file_path))
+        else:
+            with open(file_path) as f:
+                matches_data = json.load(f)
         
         if not isinstance(matches_data, list):
             raise ValueError(f"Expected matches_data to be a list, got {type(matches_data)}")
@@ -28,157 +59,922 @@ class DataLoader:
             
         print(f"Successfully loaded {len(matches_data)} matches")
         return matches_data
+    
+    @staticmethod
+    def iter_match_data(file_path: str, read_size: int = READ_BUFFER_SIZE) -> Iterator[Dict]:
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"The file {file_path} does not exist")
+        
+        if os.path.isdir(file_path):
+            yield from DataLoader.iter_raw_store(file_path)
+            return
+        
+        if file_path.endswith(NDJSON_EXTENSIONS):
+            yield from DataLoader.iter_ndjson(file_path)
+            return
+        
+        yield from DataLoader._iter_json_array(file_path, read_size)
+    
+    @staticmethod
+    def iter_match_texts(file_path: str, read_size: int = READ_BUFFER_SIZE) -> Iterator[Tuple[Dict, str]]:
+        yield from DataLoader._iter_json_array(file_path, read_size, with_text=True)
+    
+    @staticmethod
+    def iter_ndjson(file_path: str, start: int = 0, end: Optional[int] = None, with_text: bool = False) -> Iterator:
+        with open(file_path, "rb") as f:
+            if start > 0:
+                f.seek(start - 1)
+                f.readline()
+            
+            position = f.tell()
+            while end is None or position < end:
+                line = f.readline()
+                if not line:
+                    break
+                position += len(line)
+                if line.strip():
+                    yield (json.loads(line), line) if with_text else json.loads(line)
+    
+    @staticmethod
+    def _iter_json_array(file_path: str, read_size: int = READ_BUFFER_SIZE, with_text: bool = False) -> Iterator:
+        decoder = json.JSONDecoder()
+        with open(file_path, encoding="utf-8") as f:
+            buffer = f.read(read_size)
+            pos = DataLoader._skip_whitespace(buffer, 0)
+            if pos >= len(buffer) or buffer[pos] != "[":
+                raise ValueError(f"Expected {file_path} to contain a JSON array of matches")
+            pos += 1
+            eof = False
+            count = 0
+            
+            while True:
+                pos = DataLoader._skip_whitespace(buffer, pos, ",")
+                if pos >= len(buffer):
+                    if eof:
+                        raise ValueError(f"Unexpected end of file in {file_path}")
+                    more = f.read(read_size)
+                    eof = not more
+                    buffer = buffer[pos:] + more
+                    pos = 0
+                    continue
+                
+                if buffer[pos] == "]":
+                    break
+                
+                try:
+                    match, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    more = f.read(max(read_size, len(buffer) - pos))
+                    eof = not more
+                    buffer = buffer[pos:] + more
+                    pos = 0
+                    continue
+                
+                count += 1
+                yield (match, buffer[pos:end]) if with_text else match
+                
+                pos = end
+                if pos > read_size:
+                    buffer = buffer[pos:]
+                    pos = 0
+        
+        if count == 0:
+            print("Warning: No matches found in the data file")
+        print(f"Successfully streamed {count} matches")
+    
+    @staticmethod
+    def iter_raw_store(directory: str) -> Iterator[Dict]:
+        store = RawMatchStore(directory, readonly=True)
+        if len(store) == 0:
+            print("Warning: No matches found in the raw store")
+        
+        count = 0
+        for match in store.iter_matches():
+            count += 1
+            yield match
+        print(f"Successfully streamed {count} matches from {directory}")
+    
+    @staticmethod
+    def _skip_whitespace(buffer: str, pos: int, extra: str = "") -> int:
+        while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] in extra):
+            pos += 1
+        return pos
 
 
 class MatchProcessor:
     
-    def __init__(self):
+    def __init__(self, profiler: Optional[StageProfiler] = None):
         self.processed_games = 0
         self.skipped_games = 0
+        self.profiler = profiler or StageProfiler(enabled=False)
+        self.player_fields = [name for name in PLAYERS_SCHEMA if name != 'gameId' and name not in UNWANTED_STATS]
+        self.game_fields = [name for name in MATCHES_SCHEMA if name in GAME_INFO_FIELDS]
     
-    def extract_team_data(self, game_id: int, team: Dict, game_duration: int) -> Optional[List]:
+    def extract_team_data(self, batch: ColumnarBatch, game_id: int, team: Dict, game_duration: int) -> bool:
         if 'teamId' not in team:
             print(f"Warning: Team in game {game_id} missing 'teamId' - skipping")
-            return None
+            return False
             
         team_id = team['teamId']
 
         if 'win' not in team:
             print(f"Warning: Team in game {game_id} missing 'win' - skipping")
-            return None
-            
-        team_win = team['win']
+            return False
+        
+        row = batch.new_row()
+        batch.set(row, 'gameId', game_id)
+        batch.set(row, 'teamId', team_id)
+        batch.set(row, 'win', team['win'])
+        batch.set(row, 'gameDuration', game_duration)
         
         if 'bans' not in team or not isinstance(team['bans'], list):
             print(f"Warning: Team {team_id} in game {game_id} has invalid 'bans' data")
-            bans = [None] * 5
         else:
-            bans = []
-            for ban in team['bans']:
-                if isinstance(ban, dict) and 'championId' in ban:
-                    bans.append(ban['championId'])
-                else:
-                    bans.append(None)
-            
-            bans = (bans + [None] * 5)[:5]
+            for ban_number, ban in enumerate(team['bans'][:5], 1):
+                if isinstance(ban, dict):
+                    batch.set(row, f'ban{ban_number}', ban.get('championId'))
         
-        objectives = []
         if 'objectives' not in team or not isinstance(team['objectives'], dict):
             print(f"Warning: Team {team_id} in game {game_id} has invalid 'objectives' data")
-            objectives = [False, 0] * 7
         else:
-            try:
-                for objective in team['objectives']:
-                    obj_data = team['objectives'][objective]
-                    first = obj_data.get('first', False)
-                    kills = obj_data.get('kills', 0)
-                    objectives.extend([first, kills])
-            except Exception as e:
-                print(f"Error processing objectives for team {team_id} in game {game_id}: {e}")
-                objectives = [False, 0] * 7
-        
-        return [game_id, team_id, team_win, game_duration] + bans + objectives
-    
-    def extract_player_data(self, game_id: int, player: Dict) -> List:
-        player_data = [game_id]
-        
-        for key, value in player.items():
-            if key not in UNWANTED_STATS:
-                player_data.append(value)
-                
-        return player_data
+            for objective, obj_data in team['objectives'].items():
+                if isinstance(obj_data, dict):
+                    batch.set(row, f'{objective}First', obj_data.get('first'))
+                    batch.set(row, f'{objective}Kills', obj_data.get('kills'))
+        
+        return True
     
-    def process_matches(self, matches_data: List[Dict]) -> Tuple[List[List], List[List]]:
-        aggregated_matches_data = []
-        aggregated_players_data = []
+    def extract_player_data(self, batch: ColumnarBatch, game_id: int, player: Dict,
+                            columns: Optional[List[List]] = None) -> None:
+        row = batch.new_row()
+        try:
+            batch.set(row, 'gameId', game_id)
+            batch.set_fields(row, player, self.player_fields, columns)
+        except Exception:
+            batch.discard_row(row)
+            raise
+    
+    def process_matches(self, matches_data: List[Dict]) -> Tuple[pa.Table, pa.Table]:
+        self.processed_games = 0
+        self.skipped_games = 0
+        
+        matches_table, players_table = self._extract_games(matches_data, capacity=len(matches_data))
         
+        print(f"Processed {self.processed_games} games successfully, skipped {self.skipped_games} games")
+        return matches_table, players_table
+    
+    def iter_processed_chunks(self, matches: Iterable[Dict],
+                              chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[pa.Table, pa.Table]]:
         self.processed_games = 0
         self.skipped_games = 0
         
-        for game_index, game in enumerate(matches_data):
-            try:
-                if 'info' not in game:
-                    print(f"Warning: Game at index {game_index} missing 'info' key - skipping")
-                    self.skipped_games += 1
-                    continue
+        chunk = []
+        start_index = 0
+        for game in matches:
+            chunk.append(game)
+            if len(chunk) >= chunk_size:
+                yield self._extract_games(chunk, start_index, capacity=chunk_size)
+                start_index += len(chunk)
+                chunk = []
+        
+        if chunk:
+            yield self._extract_games(chunk, start_index, capacity=len(chunk))
+        
+        print(f"Processed {self.processed_games} games successfully, skipped {self.skipped_games} games")
+    
+    def _extract_games(self, games: Iterable[Dict], start_index: int = 0,
+                       capacity: int = CHUNK_SIZE) -> Tuple[pa.Table, pa.Table]:
+        matches_batch = ColumnarBatch(MATCHES_SCHEMA, capacity * 2)
+        players_batch = ColumnarBatch(PLAYERS_SCHEMA, capacity * 10)
+        player_columns = players_batch.column_values(self.player_fields)
+        profiler = self.profiler
+        
+        # Teams and players are extracted in two passes so each can be timed on its own.
+        participants_by_game = []
+        with profiler.stage("extract_teams"):
+            for game_index, game in enumerate(games, start_index):
+                try:
+                    if 'info' not in game:
+                        print(f"Warning: Game at index {game_index} missing 'info' key - skipping")
+                        self.skipped_games += 1
+                        continue
+                        
+                    game_info = game['info']
                     
-                game_info = game['info']
-                
-                if 'gameId' not in game_info:
-                    print(f"Warning: Game at index {game_index} missing 'gameId' - skipping")
-                    self.skipped_games += 1
-                    continue
+                    if 'gameId' not in game_info:
+                        print(f"Warning: Game at index {game_index} missing 'gameId' - skipping")
+                        self.skipped_games += 1
+                        continue
+                        
+                    if 'gameDuration' not in game_info:
+                        print(f"Warning: Game ID {game_info.get('gameId', 'unknown')} "
+                              f"missing 'gameDuration' - skipping")
+                        self.skipped_games += 1
+                        continue
+                    
+                    game_id = game_info['gameId']
+                    game_duration = game_info['gameDuration']
+                    
+                    if 'teams' in game_info and isinstance(game_info['teams'], list):
+                        for team in game_info['teams']:
+                            if self.extract_team_data(matches_batch, game_id, team, game_duration):
+                                matches_batch.set_fields(len(matches_batch) - 1, game_info, self.game_fields)
+                    else:
+                        print(f"Warning: Game ID {game_id} has invalid 'teams' data - skipping teams processing")
                     
-                if 'gameDuration' not in game_info:
-                    print(f"Warning: Game ID {game_info.get('gameId', 'unknown')} missing 'gameDuration' - skipping")
+                    if 'participants' in game_info and isinstance(game_info['participants'], list):
+                        participants_by_game.append((game_id, game_info['participants']))
+                    else:
+                        print(f"Warning: Game ID {game_id} has invalid 'participants' data "
+                              f"- skipping players processing")
+                    
+                    self.processed_games += 1
+                    
+                except Exception as e:
+                    print(f"Error processing game at index {game_index}: {e}")
                     self.skipped_games += 1
-                    continue
-                
-                game_id = game_info['gameId']
-                game_duration = game_info['gameDuration']
-                
-                match_data = []
-                if 'teams' in game_info and isinstance(game_info['teams'], list):
-                    for team in game_info['teams']:
-                        team_data = self.extract_team_data(game_id, team, game_duration)
-                        if team_data:
-                            match_data.append(team_data)
-                else:
-                    print(f"Warning: Game ID {game_id} has invalid 'teams' data - skipping teams processing")
-                
-                players_data = []
-                if 'participants' in game_info and isinstance(game_info['participants'], list):
-                    for player in game_info['participants']:
-                        try:
-                            player_data = self.extract_player_data(game_id, player)
-                            players_data.append(player_data)
-                        except Exception as e:
-                            print(f"Error processing player in game {game_id}: {e}")
-                else:
-                    print(f"Warning: Game ID {game_id} has invalid 'participants' data - skipping players processing")
-                
-                aggregated_matches_data.extend(match_data)
-                aggregated_players_data.extend(players_data)
-                
-                self.processed_games += 1
-                
-            except Exception as e:
-                print(f"Error processing game at index {game_index}: {e}")
-                self.skipped_games += 1
+        profiler.add_rows("extract_teams", len(matches_batch))
         
-        print(f"Processed {self.processed_games} games successfully, skipped {self.skipped_games} games")
-        return aggregated_matches_data, aggregated_players_data
+        with profiler.stage("extract_players"):
+            for game_id, participants in participants_by_game:
+                for player in participants:
+                    try:
+                        self.extract_player_data(players_batch, game_id, player, player_columns)
+                    except Exception as e:
+                        print(f"Error processing player in game {game_id}: {e}")
+        profiler.add_rows("extract_players", len(players_batch))
+        
+        with profiler.stage("frame_build", len(matches_batch) + len(players_batch)):
+            return matches_batch.to_arrow(), players_batch.to_arrow()
+
+
+def sort_table(table: pa.Table, sort_order: Optional[List[Tuple[str, str]]]) -> pa.Table:
+    if not sort_order or table.num_rows == 0:
+        return table
+    return table.sort_by(sort_order)
+
+
+def sorting_columns(schema: pa.Schema, sort_order: Optional[List[Tuple[str, str]]]) -> Optional[Tuple]:
+    # Recorded in every row group's metadata; each row group is sorted even
+    # when the file as a whole is only sorted chunk by chunk.
+    return pq.SortingColumn.from_ordering(schema, sort_order) if sort_order else None
 
 
 class DataWriter:
     
     @staticmethod
-    def save_dataframe(data: List[List], columns: List[str], output_file: str) -> None:
+    def save_table(table: pa.Table, output_file: str, sort_order: Optional[List[Tuple[str, str]]] = None) -> None:
         try:
-            if not data:
+            if table.num_rows == 0:
                 print(f"Warning: No data to save to {output_file}")
-                df = pd.DataFrame(columns=columns)
-            else:
-                df = pd.DataFrame(data, columns=columns)
             
-            df.to_parquet(output_file)
-            print(f"Successfully saved {len(df)} records to {output_file}")
+            if os.path.isdir(output_file):
+                shutil.rmtree(output_file)
+            pq.write_table(sort_table(table, sort_order), output_file, compression=PARQUET_COMPRESSION,
+                           row_group_size=ROW_GROUP_SIZE, write_statistics=True,
+                           sorting_columns=sorting_columns(table.schema, sort_order))
+            print(f"Successfully saved {table.num_rows} records to {output_file}")
         except Exception as e:
             print(f"Error saving data to {output_file}: {e}")
 
 
-def main():
-    try:
-        loader = DataLoader()
-        matches_data = loader.load_match_data(INPUT_FILE)
+class DataReader:
+    # Reads a Parquet output, either one file or a partitioned dataset, as a
+    # pyarrow dataset. Only the requested columns are decoded, and filters skip
+    # partitions and row groups whose min/max statistics can't match.
+    
+    def __init__(self, path: str):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"The file {path} does not exist")
+        self.path = path
+        self.dataset = ds.dataset(path, format="parquet", partitioning="hive" if os.path.isdir(path) else None)
+    
+    @property
+    def columns(self) -> List[str]:
+        return self.dataset.schema.names
+    
+    def build_filter(self, champion_ids: Optional[Iterable[int]] = None, positions: Optional[Iterable[str]] = None,
+                     game_ids: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                     patches: Optional[Iterable[str]] = None) -> Optional[ds.Expression]:
+        # game_ids is a half-open [start, end) range; either end may be None.
+        conditions = []
+        if champion_ids is not None:
+            conditions.append(ds.field('championId').isin(list(champion_ids)))
+        if positions is not None:
+            conditions.append(ds.field('teamPosition').isin(list(positions)))
+        if game_ids is not None:
+            start, end = game_ids
+            if start is not None:
+                conditions.append(ds.field('gameId') >= start)
+            if end is not None:
+                conditions.append(ds.field('gameId') < end)
+        if patches is not None:
+            if 'patch' in self.columns:
+                conditions.append(ds.field('patch').isin(list(patches)))
+            elif 'gameVersion' in self.columns:
+                version = ds.field('gameVersion').cast(pa.string())
+                conditions.append(functools.reduce(operator.or_, [pc.starts_with(version, pattern=f"{patch}.")
+                                                                  for patch in patches]))
+            else:
+                raise ValueError(f"{self.path} has neither patch partitions nor a gameVersion column to filter on")
+        return functools.reduce(operator.and_, conditions) if conditions else None
+    
+    def read(self, columns: Optional[List[str]] = None, **filters) -> pa.Table:
+        return self.dataset.to_table(columns=columns, filter=self.build_filter(**filters))
+    
+    def iter_batches(self, columns: Optional[List[str]] = None, batch_size: int = READ_BATCH_SIZE,
+                     **filters) -> Iterator[pa.RecordBatch]:
+        for batch in self.dataset.to_batches(columns=columns, filter=self.build_filter(**filters),
+                                             batch_size=batch_size):
+            if batch.num_rows:
+                yield batch
+    
+    def count(self, **filters) -> int:
+        return self.dataset.count_rows(filter=self.build_filter(**filters))
+    
+    def to_pandas(self, columns: Optional[List[str]] = None, **filters):
+        return self.read(columns, **filters).to_pandas()
+
+
+class ParquetChunkWriter:
+    
+    def __init__(self, output_file: str, schema: pa.Schema, sort_order: Optional[List[Tuple[str, str]]] = None):
+        self.output_file = output_file
+        self.schema = schema
+        self.sort_order = sort_order
+        self.temp_file = output_file + ".tmp"
+        self.writer = pq.ParquetWriter(self.temp_file, schema, compression=PARQUET_COMPRESSION,
+                                       write_statistics=True, sorting_columns=sorting_columns(schema, sort_order))
+        self.rows_written = 0
+    
+    def write_chunk(self, table: pa.Table) -> None:
+        if table.num_rows == 0:
+            return
+        
+        self.writer.write_table(sort_table(table, self.sort_order), row_group_size=ROW_GROUP_SIZE)
+        self.rows_written += table.num_rows
+    
+    def close(self) -> None:
+        if self.rows_written == 0:
+            print(f"Warning: No data to save to {self.output_file}")
+        self.writer.close()
+        
+        if os.path.isdir(self.output_file):
+            shutil.rmtree(self.output_file)
+        os.replace(self.temp_file, self.output_file)
+        print(f"Successfully saved {self.rows_written} records to {self.output_file}")
+    
+    def abort(self) -> None:
+        self.writer.close()
+        if os.path.exists(self.temp_file):
+            os.remove(self.temp_file)
+    
+    def __enter__(self) -> "ParquetChunkWriter":
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def export_training_chunk(exporter: Optional[TrainingExporter], profiler: StageProfiler,
+                          matches_table: pa.Table, players_table: pa.Table) -> None:
+    if exporter is None:
+        return
+    with profiler.stage("export"):
+        games = exporter.write_chunk(matches_table, players_table)
+    profiler.add_rows("export", games)
+
+
+def finish_training_export(export_dir: Optional[str], runs: Optional[List[str]] = None) -> None:
+    if export_dir is None:
+        return
+    manifest = write_manifest(export_dir, runs=runs)
+    print(f"Training matrices for {manifest['rows']} games in {len(manifest['shards'])} shards in {export_dir}")
+
+
+def run_in_memory(input_file: str, profiler: Optional[StageProfiler] = None, export_dir: Optional[str] = None) -> None:
+    profiler = profiler or StageProfiler(enabled=False)
+    loader = DataLoader()
+    with profiler.stage("load"):
+        matches_data = loader.load_match_data(input_file)
+    profiler.add_rows("load", len(matches_data))
+    
+    processor = MatchProcessor(profiler)
+    matches_table, players_table = processor.process_matches(matches_data)
+    
+    writer = DataWriter()
+    with profiler.stage("write", matches_table.num_rows + players_table.num_rows):
+        writer.save_table(matches_table, MATCHES_OUTPUT, MATCHES_SORT_ORDER)
+        writer.save_table(players_table, PLAYERS_OUTPUT, PLAYERS_SORT_ORDER)
+    
+    if export_dir is not None:
+        prepare_export_dir(export_dir)
+        export_training_chunk(TrainingExporter(export_dir), profiler, matches_table, players_table)
+        finish_training_export(export_dir)
+
+
+def run_streaming(input_file: str, chunk_size: int = CHUNK_SIZE, profiler: Optional[StageProfiler] = None,
+                  export_dir: Optional[str] = None) -> None:
+    profiler = profiler or StageProfiler(enabled=False)
+    processor = MatchProcessor(profiler)
+    matches = profiler.iterate("load", DataLoader.iter_match_data(input_file))
+    exporter = None
+    if export_dir is not None:
+        prepare_export_dir(export_dir)
+        exporter = TrainingExporter(export_dir)
+    
+    with ParquetChunkWriter(MATCHES_OUTPUT, arrow_schema(MATCHES_SCHEMA), MATCHES_SORT_ORDER) as matches_writer, \
+            ParquetChunkWriter(PLAYERS_OUTPUT, arrow_schema(PLAYERS_SCHEMA), PLAYERS_SORT_ORDER) as players_writer:
+        for matches_table, players_table in processor.iter_processed_chunks(matches, chunk_size):
+            with profiler.stage("write", matches_table.num_rows + players_table.num_rows):
+                matches_writer.write_chunk(matches_table)
+                players_writer.write_chunk(players_table)
+            export_training_chunk(exporter, profiler, matches_table, players_table)
+    finish_training_export(export_dir)
+
+
+class PartitionedChunkWriter:
+    
+    def __init__(self, matches_dir: str, players_dir: str, basename_prefix: str,
+                 partition_columns: List[str] = PARTITION_COLUMNS):
+        self.matches_dir = matches_dir
+        self.players_dir = players_dir
+        self.basename_prefix = basename_prefix
+        self.partition_columns = list(partition_columns)
+        self.partitioning = ds.partitioning(pa.schema([(name, pa.string()) for name in self.partition_columns]),
+                                            flavor="hive")
+        parquet_format = ds.ParquetFileFormat()
+        self.matches_options = parquet_format.make_write_options(
+            compression=PARQUET_COMPRESSION, write_statistics=True,
+            sorting_columns=sorting_columns(arrow_schema(MATCHES_SCHEMA), MATCHES_SORT_ORDER))
+        self.players_options = parquet_format.make_write_options(
+            compression=PARQUET_COMPRESSION, write_statistics=True,
+            sorting_columns=sorting_columns(arrow_schema(PLAYERS_SCHEMA), PLAYERS_SORT_ORDER))
+        self.chunks_written = 0
+        self.matches_written = 0
+        self.players_written = 0
+    
+    def write_chunk(self, matches_table: pa.Table, players_table: pa.Table) -> None:
+        keys = {}
+        unknown = tuple(UNKNOWN_PARTITION for _ in self.partition_columns)
+        for game_id, version, created, platform in zip(matches_table.column('gameId').to_pylist(),
+                                                       matches_table.column('gameVersion').to_pylist(),
+                                                       matches_table.column('gameCreation').to_pylist(),
+                                                       matches_table.column('platformId').to_pylist()):
+            values = {'region': region_from_platform(platform), 'patch': patch_from_version(version),
+                      'date': date_from_creation(created)}
+            keys[game_id] = tuple(values[name] for name in self.partition_columns)
+        
+        for table, base_dir, attr, sort_order, file_options in (
+                (matches_table, self.matches_dir, 'matches_written', MATCHES_SORT_ORDER, self.matches_options),
+                (players_table, self.players_dir, 'players_written', PLAYERS_SORT_ORDER, self.players_options)):
+            if table.num_rows == 0:
+                continue
+            table = sort_table(table, sort_order)
+            partition_values = [keys.get(game_id, unknown) for game_id in table.column('gameId').to_pylist()]
+            for position, name in enumerate(self.partition_columns):
+                table = table.append_column(name, pa.array([values[position] for values in partition_values],
+                                                           type=pa.string()))
+            ds.write_dataset(table, base_dir, format="parquet", partitioning=self.partitioning,
+                             basename_template=f"{self.basename_prefix}-{self.chunks_written:05d}-{{i}}.parquet",
+                             existing_data_behavior="overwrite_or_ignore", file_options=file_options,
+                             max_rows_per_group=ROW_GROUP_SIZE, preserve_order=True)
+            setattr(self, attr, getattr(self, attr) + table.num_rows)
+        
+        self.chunks_written += 1
+
+
+class IncrementalManifest:
+    
+    def __init__(self, dataset_dir: str):
+        self.dataset_dir = dataset_dir
+        self.path = os.path.join(dataset_dir, MANIFEST_FILE)
+        self.ids_path = os.path.join(dataset_dir, GAME_IDS_FILE)
+        self.data = {"runs": [], "cursors": {}, "game_ids": 0, "partitioning": list(PARTITION_COLUMNS)}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.data.update({"partitioning": LEGACY_PARTITION_COLUMNS, **json.load(f)})
+            # Ids appended by a run that crashed before committing are dropped.
+            committed_bytes = self.data["game_ids"] * GAME_ID_DTYPE.itemsize
+            if os.path.exists(self.ids_path) and os.path.getsize(self.ids_path) > committed_bytes:
+                with open(self.ids_path, "r+b") as f:
+                    f.truncate(committed_bytes)
+    
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+    
+    def partition_columns(self) -> List[str]:
+        return self.data["partitioning"]
+    
+    def runs(self) -> List[str]:
+        return self.data["runs"]
+    
+    def cursor(self, input_path: str) -> int:
+        return self.data["cursors"].get(os.path.abspath(input_path), 0)
+    
+    def game_ids(self) -> np.ndarray:
+        # Sorted committed ids, small enough to send to every worker.
+        if not os.path.exists(self.ids_path):
+            return np.zeros(0, dtype=GAME_ID_DTYPE)
+        return np.unique(np.fromfile(self.ids_path, dtype=GAME_ID_DTYPE))
+    
+    def remove_uncommitted(self, *dataset_dirs: str) -> int:
+        committed = set(self.data["runs"])
+        removed = 0
+        for dataset_dir in dataset_dirs:
+            for root, _, files in os.walk(dataset_dir):
+                for name in files:
+                    if name.startswith("part-") and name.split("-")[1] not in committed:
+                        os.remove(os.path.join(root, name))
+                        removed += 1
+        if removed:
+            print(f"Removed {removed} files left behind by an interrupted incremental run")
+        return removed
+    
+    def commit(self, run_id: str, input_path: str, cursor: Optional[int], game_ids: Iterable[int]) -> None:
+        # Only ids that aren't committed yet, so the file never holds a game twice.
+        ids = np.setdiff1d(np.array(list(game_ids), dtype=GAME_ID_DTYPE), self.game_ids())
+        with open(self.ids_path, "ab") as f:
+            ids.tofile(f)
         
-        processor = MatchProcessor()
-        match_data, player_data = processor.process_matches(matches_data)
+        self.data["runs"].append(run_id)
+        self.data["game_ids"] += len(ids)
+        if cursor is not None:
+            self.data["cursors"][os.path.abspath(input_path)] = cursor
         
-        writer = DataWriter()
-        writer.save_dataframe(match_data, MATCHES_COLUMNS, MATCHES_OUTPUT)
-        writer.save_dataframe(player_data, PLAYERS_COLUMNS, PLAYERS_OUTPUT)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(temp_path, self.path)
+
+
+def region_from_platform(platform: Optional[str]) -> str:
+    if not platform:
+        return UNKNOWN_PARTITION
+    return PLATFORM_ROUTING.get(str(platform).lower(), UNKNOWN_PARTITION)
+
+
+def date_from_creation(created: Optional[int]) -> str:
+    if created is None:
+        return UNKNOWN_PARTITION
+    return datetime.fromtimestamp(created / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def _game_id(match: Dict) -> Optional[int]:
+    info = match.get('info') if isinstance(match, dict) else None
+    return info.get('gameId') if isinstance(info, dict) else None
+
+
+def _last_line_end(file_path: str) -> int:
+    size = os.path.getsize(file_path)
+    with open(file_path, "rb") as f:
+        position = size
+        while position > 0:
+            step = min(READ_BUFFER_SIZE, position)
+            f.seek(position - step)
+            block = f.read(step)
+            newline = block.rfind(b"\n")
+            if newline != -1:
+                return position - step + newline + 1
+            position -= step
+    return 0
+
+
+def plan_shards(input_path: str, shard_count: int, start: int = 0) -> Tuple[Optional[List[Tuple]], Optional[int]]:
+    if os.path.isdir(input_path):
+        index_entries, cursor = read_index(input_path, start)
+        # The store never indexes a match twice, but an id repeated in the index
+        # would land in two shards, where workers can't see each other's games.
+        match_ids, entries = set(), []
+        for match_id, segment, offset, length in index_entries:
+            if match_id not in match_ids:
+                match_ids.add(match_id)
+                entries.append((segment, offset, length))
+        step = max(1, -(-len(entries) // shard_count))
+        return [("raw", input_path, entries[i:i + step]) for i in range(0, len(entries), step)], cursor
+    
+    if input_path.endswith(NDJSON_EXTENSIONS):
+        end = _last_line_end(input_path)
+        if end < start:
+            raise ValueError(f"{input_path} is shorter than the last processed position; "
+                             "remove the output datasets to rebuild from scratch")
+        step = max(1, -(-(end - start) // shard_count))
+        return [("ndjson", input_path, offset, min(offset + step, end)) for offset in range(start, end, step)], end
+    
+    # A JSON array has no boundaries that can be found without parsing, so the
+    # parent splits it into batches of raw match texts while streaming it.
+    return None, None
+
+
+def is_new_game(match: Dict, seen_game_ids: Set[int]) -> bool:
+    # False for games already processed or seen earlier in the same input.
+    game_id = _game_id(match)
+    if game_id is None:
+        return True
+    if game_id in seen_game_ids:
+        return False
+    seen_game_ids.add(game_id)
+    return True
+
+
+def iter_json_shards(input_path: str, shard_size: int, skip_game_ids: Optional[np.ndarray] = None) -> Iterator[Tuple]:
+    return iter_text_shards(DataLoader.iter_match_texts(input_path), shard_size, skip_game_ids)
+
+
+def iter_text_shards(matches: Iterable[Tuple[Dict, Any]], shard_size: int,
+                     skip_game_ids: Optional[np.ndarray] = None) -> Iterator[Tuple]:
+    # Batches of raw match texts split by the parent, which sees the whole input
+    # and so can drop every repeated game before it reaches a worker.
+    seen_game_ids = set(skip_game_ids.tolist()) if skip_game_ids is not None else None
+    texts = []
+    for match, text in matches:
+        if seen_game_ids is not None and not is_new_game(match, seen_game_ids):
+            continue
+        texts.append(text)
+        if len(texts) >= shard_size:
+            yield ("json", texts)
+            texts = []
+    if texts:
+        yield ("json", texts)
+
+
+def iter_shard(shard: Tuple) -> Iterator[Dict]:
+    kind = shard[0]
+    if kind == "raw":
+        yield from read_entries(shard[1], shard[2])
+    elif kind == "ndjson":
+        yield from DataLoader.iter_ndjson(shard[1], shard[2], shard[3])
+    elif kind == "json":
+        for text in shard[1]:
+            yield json.loads(text)
+    else:
+        raise ValueError(f"Unknown shard type {kind}")
+
+
+def process_shard(shard: Tuple, part_number: int, matches_dir: str, players_dir: str, chunk_size: int,
+                  run_id: Optional[str] = None, partition_columns: List[str] = PARTITION_COLUMNS,
+                  profiler: Optional[StageProfiler] = None, export_dir: Optional[str] = None,
+                  skip_game_ids: Optional[np.ndarray] = None
+                  ) -> Tuple[int, int, int, int, List[int], Optional[ChampionStats], StageProfiler]:
+    # Stages are timed on a fresh profiler that goes back with the result, so
+    # timings from worker processes can be merged by the parent.
+    profiler = profiler.spawn() if profiler else StageProfiler(enabled=False)
+    processor = MatchProcessor(profiler)
+    matches = iter_shard(shard)
+    if skip_game_ids is not None:
+        # Games already in the datasets are dropped before extraction, so they are
+        # neither written, counted in the champion stats nor exported again.
+        seen_game_ids = set(skip_game_ids.tolist())
+        matches = (match for match in matches if is_new_game(match, seen_game_ids))
+    chunks = processor.iter_processed_chunks(profiler.iterate("load", matches), chunk_size)
+    game_ids = []
+    
+    part_name = f"part-{part_number:05d}" if run_id is None else f"part-{run_id}-{part_number:05d}"
+    exporter = TrainingExporter(export_dir, part_name) if export_dir is not None else None
+    
+    if run_id is not None:
+        writer = PartitionedChunkWriter(matches_dir, players_dir, part_name, partition_columns)
+        champion_stats = ChampionStats()
+        for matches_table, players_table in chunks:
+            rows = matches_table.num_rows + players_table.num_rows
+            with profiler.stage("write", rows):
+                writer.write_chunk(matches_table, players_table)
+            with profiler.stage("aggregate", rows):
+                champion_stats.add_chunk(matches_table, players_table)
+            export_training_chunk(exporter, profiler, matches_table, players_table)
+            game_ids.extend(pc.unique(pa.chunked_array([matches_table.column('gameId'),
+                                                        players_table.column('gameId')])).to_pylist())
+        return (processor.processed_games, processor.skipped_games,
+                writer.matches_written, writer.players_written, game_ids, champion_stats, profiler)
+    
+    with ParquetChunkWriter(os.path.join(matches_dir, part_name + ".parquet"), arrow_schema(MATCHES_SCHEMA),
+                            MATCHES_SORT_ORDER) as matches_writer, \
+            ParquetChunkWriter(os.path.join(players_dir, part_name + ".parquet"), arrow_schema(PLAYERS_SCHEMA),
+                               PLAYERS_SORT_ORDER) as players_writer:
+        for matches_table, players_table in chunks:
+            with profiler.stage("write", matches_table.num_rows + players_table.num_rows):
+                matches_writer.write_chunk(matches_table)
+                players_writer.write_chunk(players_table)
+            export_training_chunk(exporter, profiler, matches_table, players_table)
+    
+    return (processor.processed_games, processor.skipped_games,
+            matches_writer.rows_written, players_writer.rows_written, game_ids, None, profiler)
+
+
+def run_shards(shards: Iterable[Tuple], workers: int, max_pending: int, matches_dir: str, players_dir: str,
+               chunk_size: int, run_id: Optional[str] = None,
+               partition_columns: List[str] = PARTITION_COLUMNS, profiler: Optional[StageProfiler] = None,
+               export_dir: Optional[str] = None, skip_game_ids: Optional[np.ndarray] = None
+               ) -> Tuple[List[int], List[int], int, ChampionStats]:
+    totals = [0, 0, 0, 0]
+    game_ids = []
+    shard_count = 0
+    champion_stats = ChampionStats()
+    
+    def collect(result: Tuple) -> None:
+        for position, value in enumerate(result[:4]):
+            totals[position] += value
+        game_ids.extend(result[4])
+        if result[5] is not None:
+            champion_stats.merge(result[5])
+        if profiler is not None:
+            profiler.merge(result[6])
+    
+    if workers <= 1:
+        for part_number, shard in enumerate(shards):
+            collect(process_shard(shard, part_number, matches_dir, players_dir, chunk_size, run_id,
+                                  partition_columns, profiler, export_dir, skip_game_ids))
+            shard_count += 1
+        return totals, game_ids, shard_count, champion_stats
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for part_number, shard in enumerate(shards):
+            pending.append(executor.submit(process_shard, shard, part_number, matches_dir, players_dir,
+                                           chunk_size, run_id, partition_columns, profiler, export_dir,
+                                           skip_game_ids))
+            shard_count += 1
+            if len(pending) >= max_pending:
+                collect(pending.pop(0).result())
+        for future in pending:
+            collect(future.result())
+    
+    return totals, game_ids, shard_count, champion_stats
+
+
+def prepare_dataset_dir(path: str) -> str:
+    if os.path.isfile(path):
+        os.remove(path)
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.startswith("part-") and name.endswith(".parquet"):
+            os.remove(os.path.join(path, name))
+    return path
+
+
+def run_parallel(input_file: str, workers: int, chunk_size: int = CHUNK_SIZE,
+                 profiler: Optional[StageProfiler] = None, export_dir: Optional[str] = None) -> None:
+    matches_dir = prepare_dataset_dir(MATCHES_OUTPUT)
+    players_dir = prepare_dataset_dir(PLAYERS_OUTPUT)
+    
+    shards, _ = plan_shards(input_file, workers)
+    max_pending = workers + 1
+    if shards is None:
+        shards = iter_json_shards(input_file, max(1, chunk_size // 10))
+        max_pending = workers * 2
+    
+    if export_dir is not None:
+        prepare_export_dir(export_dir)
+    totals, _, shard_count, _ = run_shards(shards, workers, max_pending, matches_dir, players_dir, chunk_size,
+                                           profiler=profiler, export_dir=export_dir)
+    
+    processed_games, skipped_games, match_rows, player_rows = totals
+    print(f"Processed {processed_games} games successfully, skipped {skipped_games} games "
+          f"across {shard_count} shards with {workers} workers")
+    print(f"Successfully saved {match_rows} records to {matches_dir}")
+    print(f"Successfully saved {player_rows} records to {players_dir}")
+    finish_training_export(export_dir)
+
+
+def run_incremental(input_file: str, workers: int = 1, chunk_size: int = CHUNK_SIZE,
+                    profiler: Optional[StageProfiler] = None, export_dir: Optional[str] = None) -> None:
+    profiler = profiler or StageProfiler(enabled=False)
+    matches_dir, players_dir = MATCHES_OUTPUT, PLAYERS_OUTPUT
+    manifest = IncrementalManifest(matches_dir)
+    rebuild = not manifest.exists()
+    
+    if rebuild:
+        print(f"No manifest found in {matches_dir}, building the partitioned datasets from scratch")
+        for path in (matches_dir, players_dir):
+            if os.path.isfile(path):
+                os.remove(path)
+            elif os.path.isdir(path):
+                shutil.rmtree(path)
+        manifest = IncrementalManifest(matches_dir)
+    os.makedirs(matches_dir, exist_ok=True)
+    os.makedirs(players_dir, exist_ok=True)
+    manifest.remove_uncommitted(matches_dir, players_dir)
+    if export_dir is not None:
+        # Shards of committed runs are kept, so the export grows with the datasets.
+        # Runs made without --export-training (or before an interruption) leave
+        # the export behind, so it is rebuilt from the datasets first.
+        exported = read_manifest(export_dir)
+        if rebuild or (exported or {}).get("runs") == manifest.runs():
+            prepare_export_dir(export_dir, keep_listed=not rebuild)
+        else:
+            print(f"{export_dir} does not cover the committed runs, rebuilding it from {matches_dir}")
+            prepare_export_dir(export_dir)
+            with profiler.stage("export"):
+                games = export_dataset(matches_dir, players_dir, export_dir)
+            profiler.add_rows("export", games)
+            write_manifest(export_dir, runs=manifest.runs())
+    
+    champion_stats = ChampionStats.load(CHAMPION_STATS_FILE)
+    if champion_stats.runs != manifest.runs():
+        print(f"{CHAMPION_STATS_FILE} does not match the committed runs, rebuilding it from {players_dir}")
+        champion_stats = ChampionStats.from_dataset(matches_dir, players_dir)
+    
+    run_id = time.strftime("%Y%m%dT%H%M%S", time.gmtime()) + f"p{os.getpid()}"
+    # The byte cursor skips what this input already had; the committed ids catch
+    # games that come back, e.g. lines appended again or a new export of the same matches.
+    skip_game_ids = manifest.game_ids()
+    start = manifest.cursor(input_file)
+    shards, cursor = plan_shards(input_file, workers, start)
+    max_pending = workers + 1
+    if shards is None:
+        shards = iter_json_shards(input_file, chunk_size if workers <= 1 else max(1, chunk_size // 10),
+                                  skip_game_ids)
+        skip_game_ids = None
+        max_pending = workers * 2
+    elif workers > 1 and input_file.endswith(NDJSON_EXTENSIONS):
+        # A game repeated in two byte ranges would reach two workers, each seeing
+        # only its own copy, so the parent splits the new lines and drops repeats.
+        shards = iter_text_shards(DataLoader.iter_ndjson(input_file, start, cursor, with_text=True),
+                                  max(1, chunk_size // 10), skip_game_ids)
+        skip_game_ids = None
+        max_pending = workers * 2
+    
+    totals, game_ids, shard_count, run_stats = run_shards(shards, workers, max_pending, matches_dir, players_dir,
+                                                          chunk_size, run_id, manifest.partition_columns(), profiler,
+                                                          export_dir, skip_game_ids)
+    with profiler.stage("commit"):
+        manifest.commit(run_id, input_file, cursor, game_ids)
+        if export_dir is not None:
+            write_manifest(export_dir, runs=manifest.runs())
+        
+        # Saved after the manifest: if this is interrupted the runs no longer match
+        # and the next run rebuilds the aggregates from the datasets.
+        champion_stats.merge(run_stats)
+        champion_stats.runs = list(manifest.runs())
+        champion_stats.save(CHAMPION_STATS_FILE)
+    
+    processed_games, skipped_games, match_rows, player_rows = totals
+    print(f"Incremental run {run_id}: processed {processed_games} new games, skipped {skipped_games} games "
+          f"across {shard_count} shards")
+    print(f"Appended {match_rows} records to {matches_dir} and {player_rows} records to {players_dir}")
+    print(f"Updated champion stats in {CHAMPION_STATS_FILE} ({len(champion_stats)} champions, "
+          f"{len(champion_stats.patches)} patches)")
+    finish_training_export(export_dir, manifest.runs())
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Convert raw match data into Parquet files")
+    parser.add_argument("--input", default=INPUT_FILE,
+                        help="JSON array or NDJSON file of matches, or a raw match store directory")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Process input shards in parallel and write a Parquet dataset directory")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only process matches added since the last incremental run and append them "
+                             "to datasets partitioned by patch and date")
+    parser.add_argument("--profile", nargs="?", const=PROFILE_OUTPUT, metavar="FILE",
+                        help="Record wall/CPU time, rows/s and peak memory per stage and save them as JSON "
+                             f"(default: {PROFILE_OUTPUT})")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="With --profile, also record the tracemalloc peak of each stage (slows processing)")
+    parser.add_argument("--cprofile", metavar="FILE", help="Write cProfile stats of the whole run to FILE")
+    parser.add_argument("--export-training", nargs="?", const=TRAINING_EXPORT_DIR, metavar="DIR",
+                        help="Also write sparse pick/ban matrices, dense team aggregates and win labels for "
+                             f"model training, in shards (default: {TRAINING_EXPORT_DIR})")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    if args.trace_memory and not args.profile:
+        args.profile = PROFILE_OUTPUT
+    profiler = StageProfiler(enabled=bool(args.profile), trace_memory=args.trace_memory)
+    try:
+        if not os.path.exists(args.input):
+            raise FileNotFoundError(f"The file {args.input} does not exist")
+        
+        with profile_calls(args.cprofile):
+            if args.incremental:
+                mode = "incremental"
+                run_incremental(args.input, args.workers, profiler=profiler, export_dir=args.export_training)
+            elif args.workers > 1:
+                mode = "parallel"
+                print(f"Processing {args.input} with {args.workers} workers")
+                run_parallel(args.input, args.workers, profiler=profiler, export_dir=args.export_training)
+            elif os.path.isdir(args.input):
+                mode = "streaming"
+                print("Input is a raw match store, using streaming mode")
+                run_streaming(args.input, profiler=profiler, export_dir=args.export_training)
+            elif os.path.getsize(args.input) > LARGE_FILE_THRESHOLD:
+                mode = "streaming"
+                print(f"Input is {os.path.getsize(args.input) / (1024 * 1024):.1f}MB, using streaming mode")
+                run_streaming(args.input, profiler=profiler, export_dir=args.export_training)
+            else:
+                mode = "in_memory"
+                run_in_memory(args.input, profiler=profiler, export_dir=args.export_training)
         
+        if profiler.enabled:
+            profiler.report()
+            profiler.write(args.profile, input=args.input, mode=mode, workers=args.workers)
         print("Processing completed successfully!")
         
     except Exception as e:
@@ -0,0 +1,177 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Mapping, Optional
+from urllib.parse import urlencode
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    expires_at REAL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_by_access ON entries (accessed_at);
+CREATE INDEX IF NOT EXISTS entries_by_hash ON entries (hash);
+"""
+
+INDEX_FILE = "cache.db"
+EVICT_TO = 0.9
+
+
+class CachedResponse:
+    # Stands in for requests.Response where the collector only needs the body.
+
+    status_code = 200
+    from_cache = True
+
+    def __init__(self, url: str, content: bytes):
+        self.url = url
+        self.content = content
+        self.headers: Dict[str, str] = {}
+
+    def __bool__(self) -> bool:
+        return True
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class ResponseCache:
+    # Bodies are stored once per sha256 of their content under blobs/, and the
+    # SQLite index maps each request (URL plus sorted params) to a blob, an
+    # optional expiry and the last access time used for LRU eviction.
+
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: Mapping[str, Optional[float]]):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = dict(ttl_seconds)
+        self.lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(directory, INDEX_FILE), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.size_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def cacheable(self, method: str) -> bool:
+        return method in self.ttl_seconds
+
+    @staticmethod
+    def request_key(url: str, params: Optional[Mapping] = None) -> str:
+        query = urlencode(sorted((params or {}).items()))
+        return hashlib.sha256(f"{url}?{query}".encode("utf-8")).hexdigest()
+
+    def blob_path(self, content_hash: str) -> str:
+        return os.path.join(self.directory, "blobs", content_hash[:2], content_hash + ".gz")
+
+    def get(self, url: str, params: Optional[Mapping] = None, allow_expired: bool = False) -> Optional[CachedResponse]:
+        key = self.request_key(url, params)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT hash, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            content_hash, expires_at = row
+            if expires_at is not None and expires_at < now and not allow_expired:
+                return None
+            self.conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+
+        try:
+            with open(self.blob_path(content_hash), "rb") as f:
+                return CachedResponse(url, gzip.decompress(f.read()))
+        except (OSError, EOFError) as e:
+            logging.warning(f"Dropping unreadable cache entry for {url}: {str(e)}")
+            with self.lock:
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._drop_blob_if_unused(content_hash)
+                self.conn.commit()
+            return None
+
+    def put(self, method: str, url: str, params: Optional[Mapping], content: bytes) -> None:
+        if not self.cacheable(method):
+            return
+        key = self.request_key(url, params)
+        content_hash = hashlib.sha256(content).hexdigest()
+        ttl = self.ttl_seconds[method]
+        now = time.time()
+
+        path = self.blob_path(content_hash)
+        with self.lock:
+            known = self.conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (content_hash,)).fetchone()
+        if not known:
+            data = gzip.compress(content, compresslevel=6)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+
+        with self.lock:
+            if not known and self.conn.execute("INSERT OR IGNORE INTO blobs (hash, size) VALUES (?, ?)",
+                                               (content_hash, len(data))).rowcount:
+                self.size_bytes += len(data)
+            previous = self.conn.execute("SELECT hash FROM entries WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, url, hash, stored_at, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, url, content_hash, now, now + ttl if ttl is not None else None, now))
+            if previous and previous[0] != content_hash:
+                self._drop_blob_if_unused(previous[0])
+            if self.size_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+    def __enter__(self) -> "ResponseCache":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def _evict(self) -> None:
+        target = self.max_bytes * EVICT_TO
+        evicted = 0
+        while self.size_bytes > target:
+            rows = self.conn.execute("SELECT key, hash FROM entries ORDER BY accessed_at LIMIT 1000").fetchall()
+            if not rows:
+                break
+            for key, content_hash in rows:
+                if self.size_bytes <= target:
+                    break
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._drop_blob_if_unused(content_hash)
+                evicted += 1
+        logging.info(f"Evicted {evicted} cached responses, cache is now {self.size_bytes / (1024 * 1024):.1f}MB")
+
+    def _drop_blob_if_unused(self, content_hash: str) -> None:
+        if self.conn.execute("SELECT 1 FROM entries WHERE hash = ? LIMIT 1", (content_hash,)).fetchone():
+            return
+        row = self.conn.execute("SELECT size FROM blobs WHERE hash = ?", (content_hash,)).fetchone()
+        self.conn.execute("DELETE FROM blobs WHERE hash = ?", (content_hash,))
+        if row:
+            self.size_bytes -= row[0]
+        try:
+            os.remove(self.blob_path(content_hash))
+        except FileNotFoundError:
+            pass
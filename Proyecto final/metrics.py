@@ -0,0 +1,198 @@
+import bisect
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from rate_limiter import parse_header_pairs
+
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+
+class LatencyHistogram:
+
+    def __init__(self, buckets: List[float] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class CollectorMetrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.requests: Dict[Tuple[str, int], int] = defaultdict(int)
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.retries: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.cache: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.sleep_seconds: Dict[str, float] = defaultdict(float)
+        self.utilization: Dict[Tuple[str, int], float] = {}
+        self.matches_stored = 0
+        self.bytes_stored = 0
+        self.exporter = None
+        self.stop_event = threading.Event()
+
+    def observe_request(self, endpoint: str, status: int, seconds: float) -> None:
+        with self.lock:
+            self.requests[(endpoint, status)] += 1
+            histogram = self.latency.get(endpoint)
+            if histogram is None:
+                histogram = self.latency[endpoint] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def observe_retry(self, endpoint: str, reason: str) -> None:
+        with self.lock:
+            self.retries[(endpoint, reason)] += 1
+
+    def observe_cache(self, endpoint: str, result: str) -> None:
+        with self.lock:
+            self.cache[(endpoint, result)] += 1
+
+    def observe_sleep(self, reason: str, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        with self.lock:
+            self.sleep_seconds[reason] += seconds
+
+    def observe_rate_limit_headers(self, endpoint: str, headers: Mapping[str, str], route: Optional[str] = None) -> None:
+        for scope, prefix in (("app", "X-App-Rate-Limit"), (endpoint, "X-Method-Rate-Limit")):
+            if route:
+                scope = f"{route}:{scope}"
+            limits = dict((window, limit) for limit, window in parse_header_pairs(headers.get(prefix, "")))
+            counts = parse_header_pairs(headers.get(prefix + "-Count", ""))
+            with self.lock:
+                for count, window in counts:
+                    if limits.get(window):
+                        self.utilization[(scope, window)] = count / limits[window]
+
+    def record_match(self, size_bytes: int) -> None:
+        with self.lock:
+            self.matches_stored += 1
+            self.bytes_stored += size_bytes
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self.lock:
+            lines += ["# HELP riot_requests_total Requests sent to the Riot API by endpoint and status.",
+                      "# TYPE riot_requests_total counter"]
+            for (endpoint, status), n in sorted(self.requests.items()):
+                lines.append(f'riot_requests_total{{endpoint="{endpoint}",status="{status}"}} {n}')
+
+            lines += ["# HELP riot_request_duration_seconds Riot API request latency.",
+                      "# TYPE riot_request_duration_seconds histogram"]
+            for endpoint, histogram in sorted(self.latency.items()):
+                cumulative = 0
+                for bound, n in zip(histogram.buckets + [float("inf")], histogram.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'riot_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{le}"}} {cumulative}')
+                lines.append(f'riot_request_duration_seconds_sum{{endpoint="{endpoint}"}} {histogram.total:.6f}')
+                lines.append(f'riot_request_duration_seconds_count{{endpoint="{endpoint}"}} {histogram.count}')
+
+            lines += ["# HELP riot_retries_total Retried requests by endpoint and reason.",
+                      "# TYPE riot_retries_total counter"]
+            for (endpoint, reason), n in sorted(self.retries.items()):
+                lines.append(f'riot_retries_total{{endpoint="{endpoint}",reason="{reason}"}} {n}')
+
+            lines += ["# HELP riot_cache_lookups_total Response cache lookups by endpoint and result.",
+                      "# TYPE riot_cache_lookups_total counter"]
+            for (endpoint, result), n in sorted(self.cache.items()):
+                lines.append(f'riot_cache_lookups_total{{endpoint="{endpoint}",result="{result}"}} {n}')
+
+            lines += ["# HELP riot_sleep_seconds_total Time spent sleeping by reason.",
+                      "# TYPE riot_sleep_seconds_total counter"]
+            for reason, seconds in sorted(self.sleep_seconds.items()):
+                lines.append(f'riot_sleep_seconds_total{{reason="{reason}"}} {seconds:.6f}')
+
+            lines += ["# HELP riot_rate_limit_utilization Last reported rate limit usage as a fraction of the limit.",
+                      "# TYPE riot_rate_limit_utilization gauge"]
+            for (scope, window), value in sorted(self.utilization.items()):
+                lines.append(f'riot_rate_limit_utilization{{scope="{scope}",window="{window}"}} {value:.4f}')
+
+            lines += ["# HELP riot_matches_stored_total Match payloads written to the raw store.",
+                      "# TYPE riot_matches_stored_total counter",
+                      f"riot_matches_stored_total {self.matches_stored}",
+                      "# HELP riot_match_bytes_stored_total Compressed bytes written to the raw store.",
+                      "# TYPE riot_match_bytes_stored_total counter",
+                      f"riot_match_bytes_stored_total {self.bytes_stored}"]
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict:
+        elapsed = time.time() - self.started_at
+        with self.lock:
+            endpoints = {}
+            for endpoint, histogram in self.latency.items():
+                endpoints[endpoint] = {
+                    "requests": histogram.count,
+                    "mean_latency_s": histogram.total / histogram.count if histogram.count else None,
+                    "p50_latency_s": histogram.quantile(0.5),
+                    "p95_latency_s": histogram.quantile(0.95),
+                    "status": {str(status): n for (name, status), n in self.requests.items() if name == endpoint},
+                    "retries": {reason: n for (name, reason), n in self.retries.items() if name == endpoint},
+                    "cache": {result: n for (name, result), n in self.cache.items() if name == endpoint},
+                }
+            total_requests = sum(self.requests.values())
+            return {
+                "elapsed_s": elapsed,
+                "requests": total_requests,
+                "requests_per_s": total_requests / elapsed if elapsed else None,
+                "responses_429": sum(n for (_, status), n in self.requests.items() if status == 429),
+                "responses_5xx": sum(n for (_, status), n in self.requests.items() if 500 <= status < 600),
+                "retries": sum(self.retries.values()),
+                "cache_hits": sum(n for (_, result), n in self.cache.items() if result == "hit"),
+                "cache_misses": sum(n for (_, result), n in self.cache.items() if result == "miss"),
+                "sleep_s": dict(self.sleep_seconds),
+                "matches_stored": self.matches_stored,
+                "bytes_stored": self.bytes_stored,
+                "matches_per_s": self.matches_stored / elapsed if elapsed else None,
+                "rate_limit_utilization": {f"{scope}:{window}": value
+                                           for (scope, window), value in self.utilization.items()},
+                "endpoints": endpoints,
+            }
+
+    def write_prometheus(self, file_path: str) -> None:
+        self._write_atomic(file_path, self.to_prometheus())
+
+    def write_summary(self, file_path: str) -> None:
+        self._write_atomic(file_path, json.dumps(self.summary(), indent=2))
+
+    def start_exporter(self, file_path: str, interval: float) -> None:
+        def export():
+            while not self.stop_event.wait(interval):
+                self.write_prometheus(file_path)
+
+        self.exporter = threading.Thread(target=export, name="metrics-exporter", daemon=True)
+        self.exporter.start()
+
+    def stop_exporter(self) -> None:
+        self.stop_event.set()
+        if self.exporter is not None:
+            self.exporter.join()
+            self.exporter = None
+
+    @staticmethod
+    def _write_atomic(file_path: str, content: str) -> None:
+        temp_path = file_path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(content)
+        os.replace(temp_path, file_path)
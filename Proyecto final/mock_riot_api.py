@@ -0,0 +1,391 @@
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from columnar import OBJECTIVES, PLAYERS_TYPES
+from config import PLAYERS_COLUMNS
+from rate_limiter import parse_header_pairs
+
+POSITIONS = ["TOP", "JUNGLE", "MIDDLE", "BOTTOM", "UTILITY"]
+LANES = ["TOP", "JUNGLE", "MIDDLE", "BOTTOM", "BOTTOM"]
+ROLES = ["SOLO", "NONE", "SOLO", "CARRY", "SUPPORT"]
+CHAMPION_COUNT = 170
+FIRST_GAME_CREATION = 1_700_000_000_000
+
+ROUTES = [
+    ("league-exp-v4.getLeagueEntries", re.compile(r"^/lol/league-exp/v4/entries/([^/]+)/([^/]+)/([^/]+)$")),
+    ("match-v5.getMatchIdsByPUUID", re.compile(r"^/lol/match/v5/matches/by-puuid/([^/]+)/ids$")),
+    ("match-v5.getTimeline", re.compile(r"^/lol/match/v5/matches/([^/]+)/timeline$")),
+    ("match-v5.getMatch", re.compile(r"^/lol/match/v5/matches/([^/]+)$")),
+]
+
+
+def _stable_seed(text: str) -> int:
+    return zlib.crc32(text.encode("utf-8"))
+
+
+def _game_number(match_id: str) -> int:
+    digits = match_id.rsplit("_", 1)[-1]
+    return int(digits) if digits.isdigit() else _stable_seed(match_id)
+
+
+def _player_value(name: str, kind: str, slot: int, champion_id: int, rng: random.Random):
+    if name == "championId":
+        return champion_id
+    if name == "championName":
+        return f"Champion{champion_id}"
+    if name in ("teamPosition", "individualPosition"):
+        return POSITIONS[slot % 5]
+    if name == "lane":
+        return LANES[slot % 5]
+    if name == "role":
+        return ROLES[slot % 5]
+    if name == "participantId":
+        return slot + 1
+    if name == "teamId":
+        return 100 if slot < 5 else 200
+    if kind == "bool":
+        return rng.random() < 0.5
+    if kind in ("string", "dictionary"):
+        return f"{name}-{rng.randrange(100000)}"
+    if kind == "int16":
+        return rng.randrange(30)
+    return rng.randrange(60000)
+
+
+def synthetic_match(game_number: int, platform: str = "KR") -> Dict:
+    # Deterministic for a given game number, so every run and every process
+    # sees the same payload for the same match ID.
+    rng = random.Random(game_number)
+    champions = rng.sample(range(1, CHAMPION_COUNT + 1), 20)
+    winner = rng.choice((100, 200))
+    duration = rng.randrange(900, 2700)
+
+    participants = []
+    for slot in range(10):
+        player = {name: _player_value(name, PLAYERS_TYPES.get(name, "int32"), slot, champions[slot], rng)
+                  for name in PLAYERS_COLUMNS if name != "gameId"}
+        player["puuid"] = f"puuid-{rng.randrange(200000)}"
+        player["win"] = player["teamId"] == winner
+        player["challenges"] = {"kda": rng.random() * 10, "killParticipation": rng.random()}
+        player["perks"] = {"statPerks": {"defense": 5001, "flex": 5008, "offense": 5005}, "styles": []}
+        participants.append(player)
+
+    teams = []
+    for team_number, team_id in enumerate((100, 200)):
+        bans = [{"championId": champion, "pickTurn": turn + 1}
+                for turn, champion in enumerate(champions[10 + team_number * 5:15 + team_number * 5])]
+        objectives = {objective: {"first": rng.random() < 0.5, "kills": rng.randrange(12)} for objective in OBJECTIVES}
+        teams.append({"teamId": team_id, "win": team_id == winner, "bans": bans, "objectives": objectives})
+
+    return {
+        "metadata": {
+            "dataVersion": "2",
+            "matchId": f"{platform}_{game_number}",
+            "participants": [player["puuid"] for player in participants],
+        },
+        "info": {
+            "gameId": game_number,
+            "gameCreation": FIRST_GAME_CREATION + game_number * 60_000,
+            "gameDuration": duration,
+            "gameVersion": f"14.{game_number % 24 + 1}.{rng.randrange(700)}.{rng.randrange(9000)}",
+            "gameMode": "CLASSIC",
+            "platformId": platform,
+            "queueId": 420,
+            "participants": participants,
+            "teams": teams,
+        },
+    }
+
+
+def synthetic_timeline(game_number: int, platform: str = "KR") -> Dict:
+    rng = random.Random(game_number + 1)
+    minutes = synthetic_match(game_number, platform)["info"]["gameDuration"] // 60 + 1
+    frames = []
+    for minute in range(minutes):
+        participant_frames = {
+            str(slot): {
+                "totalGold": 500 + minute * rng.randrange(250, 450), "currentGold": rng.randrange(1500),
+                "xp": minute * rng.randrange(300, 500), "level": min(18, 1 + minute // 2),
+                "minionsKilled": minute * rng.randrange(4, 9), "jungleMinionsKilled": rng.randrange(60),
+                "position": {"x": rng.randrange(15000), "y": rng.randrange(15000)},
+                "damageStats": {"totalDamageDoneToChampions": minute * rng.randrange(300, 900),
+                                "totalDamageTaken": minute * rng.randrange(300, 900)},
+            } for slot in range(1, 11)
+        }
+        events = [{"type": "ITEM_PURCHASED", "timestamp": minute * 60_000 + rng.randrange(60_000),
+                   "participantId": rng.randrange(1, 11), "itemId": rng.randrange(1000, 8000)}
+                  for _ in range(rng.randrange(8))]
+        if minute and rng.random() < 0.6:
+            events.append({"type": "CHAMPION_KILL", "timestamp": minute * 60_000 + rng.randrange(60_000),
+                           "killerId": rng.randrange(1, 11), "victimId": rng.randrange(1, 11),
+                           "position": {"x": rng.randrange(15000), "y": rng.randrange(15000)},
+                           "bounty": 300, "killStreakLength": 0})
+        frames.append({"timestamp": minute * 60_000, "participantFrames": participant_frames, "events": events})
+
+    return {
+        "metadata": {"dataVersion": "2", "matchId": f"{platform}_{game_number}"},
+        "info": {"gameId": game_number, "frameInterval": 60_000, "frames": frames},
+    }
+
+
+class SlidingWindows:
+
+    def __init__(self, limits: List[Tuple[int, int]]):
+        self.limits = limits
+        self.requests = {window: deque() for _, window in limits}
+
+    def header(self) -> str:
+        return ",".join(f"{limit}:{window}" for limit, window in self.limits)
+
+    def counts(self, now: float) -> str:
+        return ",".join(f"{len(self._expire(window, now))}:{window}" for _, window in self.limits)
+
+    def retry_after(self, now: float) -> Optional[float]:
+        wait = None
+        for limit, window in self.limits:
+            requests = self._expire(window, now)
+            if len(requests) >= limit:
+                until = requests[len(requests) - limit] + window - now
+                wait = until if wait is None else max(wait, until)
+        return wait
+
+    def record(self, now: float) -> None:
+        for requests in self.requests.values():
+            requests.append(now)
+
+    def _expire(self, window: int, now: float) -> deque:
+        requests = self.requests[window]
+        while requests and requests[0] <= now - window:
+            requests.popleft()
+        return requests
+
+
+class MockRiotAPI:
+    # A local stand-in for the three endpoints the collector calls. It serves
+    # synthetic payloads and enforces the advertised limits the way Riot does:
+    # rejected requests get a 429 with Retry-After and X-Rate-Limit-Type.
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, app_limit: str = "20:1,100:120",
+                 method_limits: Optional[Dict[str, str]] = None, players_per_page: int = 50, pages: int = 1,
+                 matches_per_player: int = 20, match_pool: int = 5000, error_rate: float = 0.0,
+                 error_burst: int = 3, slow_rate: float = 0.0, slow_seconds: float = 2.0,
+                 latency: float = 0.0, seed: int = 0):
+        self.players_per_page = players_per_page
+        self.pages = pages
+        self.matches_per_player = matches_per_player
+        self.match_pool = match_pool
+        self.error_rate = error_rate
+        self.error_burst = error_burst
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.errors_left = 0
+        self.app = SlidingWindows(parse_header_pairs(app_limit))
+        self.methods = {method: SlidingWindows(parse_header_pairs(spec))
+                        for method, spec in (method_limits or {}).items()}
+        self.stats: Dict[str, int] = {"requests": 0, "ok": 0, "429": 0, "5xx": 0, "404": 0, "slow": 0}
+
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockRiotAPI":
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mock-riot-api", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self) -> "MockRiotAPI":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+    def handle(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, Dict[str, str], Optional[object]]:
+        method, match = next(((name, pattern.match(path)) for name, pattern in ROUTES if pattern.match(path)),
+                             (None, None))
+        with self.lock:
+            self.stats["requests"] += 1
+            if method is None:
+                self.stats["404"] += 1
+                return 404, {}, {"status": {"message": "Data not found", "status_code": 404}}
+            slow = self.rng.random() < self.slow_rate
+            fail = self._next_is_error()
+
+        delay = self.latency + (self.slow_seconds if slow else 0.0)
+        if delay:
+            time.sleep(delay)
+
+        with self.lock:
+            self.stats["slow"] += slow
+            now = time.time()
+            windows = self.methods.get(method)
+            headers = {"X-App-Rate-Limit": self.app.header()}
+            if windows is not None:
+                headers["X-Method-Rate-Limit"] = windows.header()
+
+            for scope, limits in (("application", self.app), ("method", windows)):
+                wait = limits.retry_after(now) if limits is not None else None
+                if wait is not None:
+                    self.stats["429"] += 1
+                    headers.update(self._count_headers(windows, now))
+                    headers["Retry-After"] = str(max(1, math.ceil(wait)))
+                    headers["X-Rate-Limit-Type"] = scope
+                    return 429, headers, {"status": {"message": "Rate limit exceeded", "status_code": 429}}
+
+            self.app.record(now)
+            if windows is not None:
+                windows.record(now)
+            headers.update(self._count_headers(windows, now))
+            if fail:
+                self.stats["5xx"] += 1
+                return 503, headers, {"status": {"message": "Service unavailable", "status_code": 503}}
+            self.stats["ok"] += 1
+
+        return 200, headers, self._payload(method, match.groups(), query)
+
+    def _next_is_error(self) -> bool:
+        # Errors come in bursts, like a backend that stays unhealthy for a few requests.
+        if self.errors_left > 0:
+            self.errors_left -= 1
+            return True
+        if self.rng.random() < self.error_rate:
+            self.errors_left = self.error_burst - 1
+            return True
+        return False
+
+    def _count_headers(self, windows: Optional[SlidingWindows], now: float) -> Dict[str, str]:
+        headers = {"X-App-Rate-Limit-Count": self.app.counts(now)}
+        if windows is not None:
+            headers["X-Method-Rate-Limit-Count"] = windows.counts(now)
+        return headers
+
+    def _payload(self, method: str, groups: Tuple[str, ...], query: Dict[str, List[str]]):
+        if method == "league-exp-v4.getLeagueEntries":
+            queue, tier, division = groups
+            page = int(query.get("page", ["1"])[0])
+            if page > self.pages:
+                return []
+            first = (page - 1) * self.players_per_page
+            return [{"puuid": f"{tier}-{division}-{first + i}", "queueType": queue, "tier": tier, "rank": division,
+                     "leaguePoints": self.players_per_page - i, "wins": 100, "losses": 90}
+                    for i in range(self.players_per_page)]
+
+        if method == "match-v5.getMatchIdsByPUUID":
+            puuid = groups[0]
+            start = int(query.get("start", ["0"])[0])
+            count = int(query.get("count", ["20"])[0])
+            base = _stable_seed(puuid)
+            game_numbers = [(base + k * 7919) % self.match_pool + 1 for k in range(self.matches_per_player)]
+            if "startTime" in query:
+                # Same creation times as synthetic_match, so a repeat crawl finds nothing new.
+                start_ms = int(query["startTime"][0]) * 1000
+                game_numbers = [n for n in game_numbers if FIRST_GAME_CREATION + n * 60_000 >= start_ms]
+            return [f"KR_{game_number}" for game_number in game_numbers[start:start + count]]
+
+        if method == "match-v5.getTimeline":
+            return synthetic_timeline(_game_number(groups[0]))
+        return synthetic_match(_game_number(groups[0]))
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                status, headers, payload = api.handle(url.path, parse_qs(url.query))
+                body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json;charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def parse_method_limits(values: List[str]) -> Dict[str, str]:
+    limits = {}
+    for value in values:
+        method, _, spec = value.partition("=")
+        if not spec:
+            raise argparse.ArgumentTypeError(f"Expected METHOD=LIMITS, got {value!r}")
+        limits[method] = spec
+    return limits
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--app-limit", default="20:1,100:120", help="Application limit as LIMIT:SECONDS pairs")
+    parser.add_argument("--method-limit", action="append", default=[], metavar="METHOD=LIMITS",
+                        help="Method limit, e.g. match-v5.getMatch=2000:10 (repeatable)")
+    parser.add_argument("--players-per-page", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=1, help="League entry pages per tier and division")
+    parser.add_argument("--matches-per-player", type=int, default=20)
+    parser.add_argument("--match-pool", type=int, default=5000, help="Distinct match IDs shared by all players")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Chance that a 5xx burst starts")
+    parser.add_argument("--error-burst", type=int, default=3, help="Consecutive 5xx responses per burst")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Chance that a response is delayed")
+    parser.add_argument("--slow-seconds", type=float, default=2.0)
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay added to every response")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def server_from_args(args: argparse.Namespace, host: str = "127.0.0.1", port: int = 0) -> MockRiotAPI:
+    return MockRiotAPI(host, port, app_limit=args.app_limit, method_limits=parse_method_limits(args.method_limit),
+                       players_per_page=args.players_per_page, pages=args.pages,
+                       matches_per_player=args.matches_per_player, match_pool=args.match_pool,
+                       error_rate=args.error_rate, error_burst=args.error_burst, slow_rate=args.slow_rate,
+                       slow_seconds=args.slow_seconds, latency=args.latency, seed=args.seed)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the Riot API endpoints the collector uses")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    api = server_from_args(args, args.host, args.port)
+    print(f"Mock Riot API listening on {api.url}")
+    print(f"Run the collector against it with --api-url {api.url}")
+    try:
+        api.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.server.server_close()
+        print(json.dumps(api.stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import logging
+import queue
+import threading
+from typing import Callable, Iterable, List
+
+STOP = object()
+POLL_INTERVAL = 0.5
+
+
+class PipelineStage:
+    # A bounded queue drained by the stage's own worker threads. put() blocks
+    # while the queue is full, which is what holds back the stage feeding it.
+
+    def __init__(self, name: str, handler: Callable, workers: int, queue_size: int, stop_event: threading.Event):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = stop_event
+        self.threads: List[threading.Thread] = []
+        self.processed = 0
+        self.lock = threading.Lock()
+
+    def start(self) -> "PipelineStage":
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def put(self, item) -> bool:
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def feed(self, items: Iterable) -> bool:
+        for item in items:
+            if not self.put(item):
+                return False
+        return True
+
+    def backlog(self) -> int:
+        return self.queue.qsize()
+
+    def close(self) -> None:
+        # Called once nothing upstream can put() anymore; every worker exits
+        # after reaching a STOP marker queued behind the remaining items.
+        for _ in self.threads:
+            if not self.put(STOP):
+                break
+        self.join()
+
+    def join(self) -> None:
+        for thread in self.threads:
+            thread.join()
+
+    def _work(self) -> None:
+        while True:
+            try:
+                item = self.queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if self.stop_event.is_set():
+                    return
+                continue
+
+            if item is STOP or self.stop_event.is_set():
+                return
+            try:
+                self.handler(item)
+            except Exception as e:
+                logging.exception(f"[{self.name}] Unhandled error for {item!r}: {str(e)}")
+            with self.lock:
+                self.processed += 1
+
+
+def feed_in_background(stage: PipelineStage, items: Iterable) -> threading.Thread:
+    thread = threading.Thread(target=stage.feed, args=(items,), name=f"{stage.name}-feeder", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,166 @@
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterable, Iterator, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MB = 1024 * 1024
+
+
+def children_cpu_s() -> float:
+    # CPU time of finished child processes, e.g. a process pool that has been shut down.
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / MB if sys.platform == "darwin" else peak / 1024
+
+
+@contextmanager
+def profile_calls(output_file: Optional[str]) -> Iterator[None]:
+    # cProfile dump of everything run inside the block, readable with pstats or snakeviz.
+    if not output_file:
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(output_file)
+        print(f"cProfile stats written to {output_file}")
+
+
+class StageProfiler:
+    # Wall time, CPU time, rows and peak memory per processing stage. A stage
+    # that runs once per chunk is accumulated over all of its calls. When
+    # disabled, stage() and iterate() add nothing to the hot path.
+
+    def __init__(self, enabled: bool = True, trace_memory: bool = False):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.stages: Dict[str, Dict] = {}
+        self.started = time.perf_counter()
+        self.started_cpu = time.process_time()
+        self.started_children_cpu = children_cpu_s()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def spawn(self) -> "StageProfiler":
+        # Empty profiler with the same settings, for a worker to fill and send back.
+        return StageProfiler(self.enabled, self.trace_memory)
+
+    def stage(self, name: str, rows: int = 0):
+        if not self.enabled:
+            return nullcontext()
+        return self._measure(name, rows)
+
+    def iterate(self, name: str, items: Iterable) -> Iterable:
+        # Charges the time spent producing each item (e.g. parsing it) to the stage.
+        if not self.enabled:
+            return items
+        return self._iterate(name, items)
+
+    def add_rows(self, name: str, rows: int) -> None:
+        if self.enabled:
+            self._entry(name)["rows"] += rows
+
+    def merge(self, other: "StageProfiler") -> None:
+        for name, stats in other.stages.items():
+            entry = self._entry(name)
+            for key in ("calls", "wall_s", "cpu_s", "rows"):
+                entry[key] += stats[key]
+            for key in ("peak_rss_mb", "tracemalloc_peak_mb"):
+                if stats[key] is not None:
+                    entry[key] = max(entry[key] or 0.0, stats[key])
+
+    @contextmanager
+    def _measure(self, name: str, rows: int) -> Iterator[None]:
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self._record(name, wall, cpu, rows)
+
+    def _iterate(self, name: str, items: Iterable) -> Iterator:
+        iterator = iter(items)
+        while True:
+            if self.trace_memory:
+                tracemalloc.reset_peak()
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._record(name, wall, cpu, 0)
+                return
+            self._record(name, wall, cpu, 1)
+            yield item
+
+    def _entry(self, name: str) -> Dict:
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "rows": 0,
+                                         "peak_rss_mb": None, "tracemalloc_peak_mb": None}
+        return entry
+
+    def _record(self, name: str, wall: float, cpu: float, rows: int) -> None:
+        entry = self._entry(name)
+        entry["calls"] += 1
+        entry["wall_s"] += time.perf_counter() - wall
+        entry["cpu_s"] += time.process_time() - cpu
+        entry["rows"] += rows
+        # ru_maxrss only grows, so this is the high-water mark once the stage has run.
+        entry["peak_rss_mb"] = peak_rss_mb()
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] / MB
+            entry["tracemalloc_peak_mb"] = max(entry["tracemalloc_peak_mb"] or 0.0, peak)
+
+    def to_dict(self) -> Dict:
+        stages = {}
+        for name, entry in self.stages.items():
+            rows, wall = entry["rows"], entry["wall_s"]
+            stages[name] = dict(entry, rows_per_s=rows / wall if rows and wall else None)
+        return {
+            "wall_s": time.perf_counter() - self.started,
+            "cpu_s": time.process_time() - self.started_cpu,
+            "children_cpu_s": children_cpu_s() - self.started_children_cpu,
+            "peak_rss_mb": peak_rss_mb(),
+            "tracemalloc_peak_mb": tracemalloc.get_traced_memory()[1] / MB if self.trace_memory else None,
+            "stages": stages,
+        }
+
+    def report(self) -> None:
+        results = self.to_dict()
+        print(f"{'Stage':<16}{'Calls':>9}{'Wall s':>10}{'CPU s':>10}{'Rows':>12}{'Rows/s':>13}"
+              f"{'RSS MB':>10}{'Traced MB':>11}")
+        for name, stage in results["stages"].items():
+            rows_per_s = f"{stage['rows_per_s']:,.0f}" if stage["rows_per_s"] else "-"
+            rss = f"{stage['peak_rss_mb']:.0f}" if stage["peak_rss_mb"] is not None else "-"
+            traced = f"{stage['tracemalloc_peak_mb']:.1f}" if stage["tracemalloc_peak_mb"] is not None else "-"
+            print(f"{name:<16}{stage['calls']:>9}{stage['wall_s']:>10.2f}{stage['cpu_s']:>10.2f}"
+                  f"{stage['rows']:>12,}{rows_per_s:>13}{rss:>10}{traced:>11}")
+        peak = f", peak RSS {results['peak_rss_mb']:.0f}MB" if results["peak_rss_mb"] is not None else ""
+        children = f" (+{results['children_cpu_s']:.2f}s in workers)" if results["children_cpu_s"] else ""
+        print(f"Total: {results['wall_s']:.2f}s wall, {results['cpu_s']:.2f}s CPU{children}{peak}")
+
+    def write(self, output_file: str, **info) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+        with open(output_file, "w") as f:
+            json.dump(dict(info, **self.to_dict()), f, indent=2)
+        print(f"Profile written to {output_file}")
@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Mapping, Optional, Set, Tuple
+
+from config import THRESHOLD, DEFAULT_APP_RATE_LIMIT
+
+
+def parse_header_pairs(header_val: str):
+    pairs = []
+    if not header_val:
+        return pairs
+    for chunk in header_val.split(","):
+        limit, window = map(int, chunk.split(":"))
+        pairs.append((limit, window))
+    return pairs
+
+
+class RateBucket:
+
+    def __init__(self, limits: List[Tuple[int, int]], margin: int = THRESHOLD):
+        self.margin = margin
+        self.windows: Dict[int, List] = {}
+        self.blocked_until = 0.0
+        self.update_limits(limits)
+
+    def update_limits(self, limits: List[Tuple[int, int]]) -> None:
+        advertised = set()
+        for limit, window in limits:
+            advertised.add(window)
+            if window in self.windows:
+                self.windows[window][0] = limit
+            else:
+                self.windows[window] = [limit, deque()]
+        for window in list(self.windows):
+            if window not in advertised:
+                del self.windows[window]
+
+    def sync_counts(self, counts: List[Tuple[int, int]], now: float) -> None:
+        for count, window in counts:
+            entry = self.windows.get(window)
+            if entry is None:
+                continue
+            stamps = entry[1]
+            self._expire(stamps, window, now)
+            for _ in range(count - len(stamps)):
+                stamps.append(now)
+
+    def wait_time(self, now: float) -> float:
+        wait = self.blocked_until - now
+        for window, (limit, stamps) in self.windows.items():
+            self._expire(stamps, window, now)
+            capacity = max(1, limit - self.margin)
+            if len(stamps) >= capacity:
+                wait = max(wait, stamps[len(stamps) - capacity] + window - now)
+        return wait
+
+    def record(self, now: float) -> None:
+        for _, stamps in self.windows.values():
+            stamps.append(now)
+
+    def utilization(self, now: float) -> float:
+        usage = 0.0
+        for window, (limit, stamps) in self.windows.items():
+            self._expire(stamps, window, now)
+            usage = max(usage, len(stamps) / limit)
+        return usage
+
+    @staticmethod
+    def _expire(stamps: deque, window: int, now: float) -> None:
+        while stamps and stamps[0] <= now - window:
+            stamps.popleft()
+
+
+class RateLimiter:
+
+    def __init__(self, app_limits: Optional[List[Tuple[int, int]]] = None, margin: int = THRESHOLD):
+        self.lock = threading.Lock()
+        self.margin = margin
+        self.app = RateBucket(app_limits or parse_header_pairs(DEFAULT_APP_RATE_LIMIT), margin)
+        self.methods: Dict[str, RateBucket] = {}
+        self.probing: Set[str] = set()
+
+    def acquire(self, method: str) -> float:
+        slept = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                bucket = self.methods.get(method)
+                # Method limits are unknown until the first response comes back,
+                # so only one probe request per method is allowed in flight.
+                if bucket is None and method in self.probing:
+                    wait = 0.05
+                else:
+                    wait = max(self.app.wait_time(now), bucket.wait_time(now) if bucket else 0.0)
+                if wait <= 0:
+                    self.app.record(now)
+                    if bucket is None:
+                        self.probing.add(method)
+                    else:
+                        bucket.record(now)
+                    return slept
+            time.sleep(wait)
+            slept += wait
+
+    def complete(self, method: str, headers: Optional[Mapping[str, str]] = None) -> None:
+        with self.lock:
+            now = time.monotonic()
+            self.probing.discard(method)
+            if headers is None:
+                return
+
+            app_limits = parse_header_pairs(headers.get("X-App-Rate-Limit", ""))
+            if app_limits:
+                self.app.update_limits(app_limits)
+            self.app.sync_counts(parse_header_pairs(headers.get("X-App-Rate-Limit-Count", "")), now)
+
+            method_limits = parse_header_pairs(headers.get("X-Method-Rate-Limit", ""))
+            bucket = self.methods.get(method)
+            if bucket is None:
+                bucket = self.methods[method] = RateBucket(method_limits, self.margin)
+            elif method_limits:
+                bucket.update_limits(method_limits)
+            bucket.sync_counts(parse_header_pairs(headers.get("X-Method-Rate-Limit-Count", "")), now)
+
+    def utilization(self, method: Optional[str] = None) -> float:
+        # Share of the tightest window already spent; 1.0 while blocked.
+        with self.lock:
+            now = time.monotonic()
+            buckets = [self.app]
+            if method in self.methods:
+                buckets.append(self.methods[method])
+            if any(bucket.blocked_until > now for bucket in buckets):
+                return 1.0
+            return max(bucket.utilization(now) for bucket in buckets)
+
+    def block(self, seconds: float, method: Optional[str] = None) -> None:
+        with self.lock:
+            until = time.monotonic() + seconds
+            bucket = self.methods.get(method) if method else self.app
+            if bucket is None:
+                bucket = self.app
+            bucket.blocked_until = max(bucket.blocked_until, until)
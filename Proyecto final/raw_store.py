@@ -0,0 +1,179 @@
+import gzip
+import json
+import os
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import SEGMENT_MAX_BYTES
+
+INDEX_FILE = "index.tsv"
+SEGMENT_TEMPLATE = "segment-{:05d}.ndjson.gz"
+
+
+class RawMatchStore:
+    # Each record is written as its own gzip member, so segments stay valid
+    # gzip streams while the index can still seek straight to one payload.
+
+    def __init__(self, directory: str, segment_max_bytes: int = SEGMENT_MAX_BYTES, readonly: bool = False):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.readonly = readonly
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.index: Dict[str, Tuple[int, int, int]] = {}
+        self.size_bytes = 0
+        self.lock = threading.Lock()
+        self.segment_file = None
+        self.index_file = None
+
+        if not readonly:
+            os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+        self.segment = max((seg for seg, _, _ in self.index.values()), default=0)
+        if not readonly:
+            self._repair_segments()
+
+    def __contains__(self, match_id: str) -> bool:
+        return match_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def ids(self) -> List[str]:
+        return list(self.index)
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, SEGMENT_TEMPLATE.format(segment))
+
+    def append(self, match_id: str, payload: Dict) -> int:
+        if self.readonly:
+            raise IOError(f"Raw store {self.directory} was opened read-only")
+
+        line = json.dumps(payload, separators=(",", ":")).encode("utf-8") + b"\n"
+        data = gzip.compress(line, compresslevel=6)
+
+        with self.lock:
+            if match_id in self.index:
+                return 0
+
+            if self.segment_file is not None and self.segment_file.tell() + len(data) > self.segment_max_bytes:
+                self.segment_file.close()
+                self.segment_file = None
+                self.segment += 1
+            if self.segment_file is None:
+                self.segment_file = open(self.segment_path(self.segment), "ab")
+            if self.index_file is None:
+                self.index_file = open(self.index_path, "a", encoding="utf-8")
+
+            offset = self.segment_file.tell()
+            self.segment_file.write(data)
+            self.segment_file.flush()
+            self.index_file.write(f"{match_id}\t{self.segment}\t{offset}\t{len(data)}\n")
+            self.index_file.flush()
+
+            self.index[match_id] = (self.segment, offset, len(data))
+            self.size_bytes += len(data)
+        return len(data)
+
+    def get(self, match_id: str) -> Optional[Dict]:
+        entry = self.index.get(match_id)
+        if entry is None:
+            return None
+        segment, offset, length = entry
+        with open(self.segment_path(segment), "rb") as f:
+            f.seek(offset)
+            return json.loads(gzip.decompress(f.read(length)))
+
+    def iter_entries(self) -> Iterator[Tuple[str, int, int, int]]:
+        for match_id, (segment, offset, length) in sorted(self.index.items(), key=lambda item: item[1]):
+            yield match_id, segment, offset, length
+
+    def iter_matches(self, segments: Optional[List[int]] = None) -> Iterator[Dict]:
+        wanted = set(segments) if segments is not None else None
+        entries = ((segment, offset, length) for _, segment, offset, length in self.iter_entries()
+                   if wanted is None or segment in wanted)
+        yield from self.read_entries(entries)
+
+    def read_entries(self, entries: Iterable[Tuple[int, int, int]]) -> Iterator[Dict]:
+        yield from read_entries(self.directory, entries)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.segment_file is not None:
+                self.segment_file.close()
+                self.segment_file = None
+            if self.index_file is not None:
+                self.index_file.close()
+                self.index_file = None
+
+    def __enter__(self) -> "RawMatchStore":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def _load_index(self) -> None:
+        entries, complete = read_index(self.directory)
+
+        # A crash can leave a partially written last line behind; it is ignored
+        # and, when writable, cut off so the next append starts on a clean line.
+        if not self.readonly and os.path.exists(self.index_path) and os.path.getsize(self.index_path) > complete:
+            with open(self.index_path, "r+b") as f:
+                f.truncate(complete)
+
+        for match_id, segment, offset, length in entries:
+            self.index[match_id] = (segment, offset, length)
+            self.size_bytes += length
+
+    def _repair_segments(self) -> None:
+        indexed_end: Dict[int, int] = {}
+        for segment, offset, length in self.index.values():
+            indexed_end[segment] = max(indexed_end.get(segment, 0), offset + length)
+
+        # Payloads written after the last index entry never made it into the
+        # index, so they are dropped and will simply be fetched again.
+        for name in os.listdir(self.directory):
+            if not (name.startswith("segment-") and name.endswith(".ndjson.gz")):
+                continue
+            segment = int(name[len("segment-"):-len(".ndjson.gz")])
+            path = os.path.join(self.directory, name)
+            if os.path.getsize(path) > indexed_end.get(segment, 0):
+                with open(path, "r+b") as f:
+                    f.truncate(indexed_end.get(segment, 0))
+            self.segment = max(self.segment, segment)
+
+
+def read_index(directory: str, start: int = 0) -> Tuple[List[Tuple[str, int, int, int]], int]:
+    index_path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return [], start
+
+    with open(index_path, "rb") as f:
+        f.seek(start)
+        content = f.read()
+
+    complete = content.rfind(b"\n") + 1
+    entries = []
+    for line in content[:complete].decode("utf-8").splitlines():
+        if not line:
+            continue
+        match_id, segment, offset, length = line.split("\t")
+        entries.append((match_id, int(segment), int(offset), int(length)))
+    return entries, start + complete
+
+
+def read_entries(directory: str, entries: Iterable[Tuple[int, int, int]]) -> Iterator[Dict]:
+    current = None
+    f = None
+    try:
+        for segment, offset, length in entries:
+            if segment != current:
+                if f is not None:
+                    f.close()
+                f = open(os.path.join(directory, SEGMENT_TEMPLATE.format(segment)), "rb")
+                current = segment
+            f.seek(offset)
+            yield json.loads(gzip.decompress(f.read(length)))
+    finally:
+        if f is not None:
+            f.close()
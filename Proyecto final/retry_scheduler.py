@@ -0,0 +1,112 @@
+import logging
+import random
+import threading
+import time
+from typing import Callable, Iterable, Optional, Set
+
+from config import MAX_MATCH_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY, RETRY_POLL_INTERVAL, RETRY_BATCH_SIZE
+from state_store import CrawlState
+
+ERROR_NOT_FOUND = "not_found"
+ERROR_CLIENT = "client_error"
+ERROR_RATE_LIMITED = "rate_limited"
+ERROR_SERVER = "server_error"
+ERROR_NETWORK = "network"
+ERROR_PARSE = "parse_error"
+ERROR_UNKNOWN = "unknown"
+
+PERMANENT_ERRORS = {ERROR_NOT_FOUND}
+
+
+def classify_status(status_code: Optional[int]) -> str:
+    if status_code == 404:
+        return ERROR_NOT_FOUND
+    if status_code == 429:
+        return ERROR_RATE_LIMITED
+    if status_code is not None and 500 <= status_code < 600:
+        return ERROR_SERVER
+    if status_code is not None and 400 <= status_code < 500:
+        return ERROR_CLIENT
+    return ERROR_UNKNOWN
+
+
+def retry_delay(attempts: int, base: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY) -> float:
+    delay = min(max_delay, base * (2 ** max(0, attempts - 1)))
+    return delay + random.uniform(0, 0.1 * delay)
+
+
+class RetryScheduler:
+    # Failed matches get an error class, an attempt count and the time they may
+    # be tried again. Due retries are only handed out while a region's limiter
+    # has budget to spare, so they never compete with the main crawl.
+
+    def __init__(self, state: CrawlState, regions: Iterable[str], submit: Callable[[str, str], bool],
+                 has_spare_budget: Callable[[str], bool], poll_interval: float = RETRY_POLL_INTERVAL,
+                 batch_size: int = RETRY_BATCH_SIZE, max_attempts: int = MAX_MATCH_ATTEMPTS):
+        self.state = state
+        self.regions = list(regions)
+        self.submit = submit
+        self.has_spare_budget = has_spare_budget
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.in_flight: Set[str] = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.retried = 0
+        self.recovered = 0
+
+    def start(self) -> "RetryScheduler":
+        self.thread = threading.Thread(target=self._run, name="retry-scheduler", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def schedule_due(self, only_spare: bool = True, limit: Optional[int] = None) -> int:
+        scheduled = 0
+        for region in self.regions:
+            if only_spare and not self.has_spare_budget(region):
+                continue
+            for match_id in self.state.due_retries(region, time.time(), limit):
+                with self.lock:
+                    if match_id in self.in_flight:
+                        continue
+                    self.in_flight.add(match_id)
+                if not self.submit(region, match_id):
+                    with self.lock:
+                        self.in_flight.discard(match_id)
+                    return scheduled
+                scheduled += 1
+        return scheduled
+
+    def record_success(self, match_id: str) -> None:
+        with self.lock:
+            if match_id in self.in_flight:
+                self.in_flight.discard(match_id)
+                self.recovered += 1
+
+    def record_failure(self, match_id: str, error_class: str, error: Optional[str] = None) -> bool:
+        attempts = self.state.match_attempts(match_id) + 1
+        permanent = error_class in PERMANENT_ERRORS or attempts >= self.max_attempts
+        next_attempt_at = None if permanent else time.time() + retry_delay(attempts)
+        self.state.mark_failed(match_id, error, error_class, next_attempt_at, permanent)
+        with self.lock:
+            if match_id in self.in_flight:
+                self.in_flight.discard(match_id)
+                self.retried += 1
+        if permanent:
+            logging.info(f"Giving up on match {match_id} after {attempts} attempts ({error_class})")
+        return permanent
+
+    def _run(self) -> None:
+        while not self.stop_event.wait(self.poll_interval):
+            try:
+                self.schedule_due(limit=self.batch_size)
+            except Exception as e:
+                logging.exception(f"Retry scheduling failed: {str(e)}")
@@ -0,0 +1,218 @@
+import logging
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests import Session, HTTPError, ConnectionError, Timeout
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+
+from config import API_KEY, API_URL, BASE_TIMEOUT, MAX_RETRIES, PLATFORM_ROUTING
+from http_cache import ResponseCache
+from metrics import CollectorMetrics
+from rate_limiter import RateLimiter, parse_header_pairs
+from retry_scheduler import classify_status, ERROR_NETWORK, ERROR_RATE_LIMITED, ERROR_UNKNOWN
+
+METHOD_LEAGUE_ENTRIES = "league-exp-v4.getLeagueEntries"
+METHOD_MATCH_IDS = "match-v5.getMatchIdsByPUUID"
+METHOD_MATCH = "match-v5.getMatch"
+METHOD_TIMELINE = "match-v5.getTimeline"
+
+
+class FailedFetch:
+    # Falsy like the None it replaces, but says why the request failed so the
+    # retry scheduler can tell permanent failures from transient ones.
+
+    def __init__(self, error_class: str, message: str):
+        self.error_class = error_class
+        self.message = message
+
+    def __bool__(self) -> bool:
+        return False
+
+
+def exponential_backoff(attempt: int, base: float = 1, max_backoff: float = 60) -> float:
+    delay = min(max_backoff, base * (2 ** attempt))
+    jitter = random.uniform(0, 0.1 * delay)
+    return delay + jitter
+
+
+def platform_of(match_id: str, default: str) -> str:
+    prefix = match_id.split("_", 1)[0].lower()
+    return prefix if prefix in PLATFORM_ROUTING else default
+
+
+class RiotClient:
+    # Riot enforces limits per routing value, so every API host gets its own
+    # session, connection pool and rate limiter, created on first use.
+
+    def __init__(self, api_key: str = API_KEY, api_url: str = API_URL, cache: Optional[ResponseCache] = None,
+                 offline: bool = False, metrics: Optional[CollectorMetrics] = None, pool_size: int = 20):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.cache = cache
+        self.offline = offline
+        self.metrics = metrics or CollectorMetrics()
+        self.pool_size = pool_size
+        self.clients: Dict[str, Tuple[Session, RateLimiter]] = {}
+        self.lock = threading.Lock()
+
+    def new_session(self) -> Session:
+        adapter = requests.adapters.HTTPAdapter(
+            max_retries=0,
+            pool_connections=10,
+            pool_maxsize=max(20, self.pool_size)
+        )
+
+        session = Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({
+            "X-Riot-Token": self.api_key,
+            "User-Agent": "MyLoLTool/1.0 (https://github.com/you/mytool; you@example.com)",
+            "Accept-Encoding": "gzip",
+        })
+        return session
+
+    def client_for(self, url: str) -> Tuple[Session, RateLimiter]:
+        host = urlparse(url).netloc
+        with self.lock:
+            client = self.clients.get(host)
+            if client is None:
+                client = self.clients[host] = (self.new_session(), RateLimiter())
+            return client
+
+    def limiter_for(self, route: str) -> RateLimiter:
+        return self.client_for(self.route_url(route))[1]
+
+    def route_url(self, route: str) -> str:
+        return self.api_url.format(route=route).rstrip("/")
+
+    def close(self) -> None:
+        with self.lock:
+            for session, _ in self.clients.values():
+                session.close()
+            self.clients.clear()
+
+    def fetch_respecting_headers(self, url: str, params: Optional[Dict] = None, max_retries: int = MAX_RETRIES,
+                                 method: Optional[str] = None, route: Optional[str] = None):
+        method = method or url
+        metrics = self.metrics
+        use_cache = self.cache is not None and self.cache.cacheable(method)
+        if use_cache:
+            cached = self.cache.get(url, params, allow_expired=self.offline)
+            metrics.observe_cache(method, "hit" if cached else "miss")
+            if cached or self.offline:
+                return cached
+        elif self.offline:
+            return None
+
+        session, limiter = self.client_for(url)
+        error_class = ERROR_UNKNOWN
+        for attempt in range(max_retries):
+            try:
+                timeout = BASE_TIMEOUT * (1 + attempt * 0.5)
+
+                metrics.observe_sleep("rate_limit", limiter.acquire(method))
+                started = time.perf_counter()
+                try:
+                    resp = session.get(url, params=params, timeout=timeout)
+                except BaseException:
+                    limiter.complete(method)
+                    raise
+                limiter.complete(method, resp.headers)
+                metrics.observe_request(method, resp.status_code, time.perf_counter() - started)
+                metrics.observe_rate_limit_headers(method, resp.headers, route)
+
+                if resp.status_code == 429:
+                    app_limits = parse_header_pairs(resp.headers.get("X-App-Rate-Limit", ""))
+                    app_counts = parse_header_pairs(resp.headers.get("X-App-Rate-Limit-Count", ""))
+
+                    if "Retry-After" in resp.headers:
+                        wait = int(resp.headers["Retry-After"])
+                    else:
+                        violated = [w for (L, w), (c, _) in zip(app_limits, app_counts) if c >= L]
+                        wait = max(violated) if violated else 1
+
+                    limit_type = resp.headers.get("X-Rate-Limit-Type", "application")
+                    logging.warning(f"[429] Rate limited ({limit_type}). Sleeping {wait}s (attempt {attempt+1}/{max_retries})")
+                    metrics.observe_retry(method, "429")
+                    error_class = ERROR_RATE_LIMITED
+                    if limit_type == "service":
+                        time.sleep(wait)
+                        metrics.observe_sleep("retry_after", wait)
+                    else:
+                        limiter.block(wait, method if limit_type == "method" else None)
+                    continue
+
+                elif 500 <= resp.status_code < 600:
+                    wait = exponential_backoff(attempt)
+                    logging.warning(f"[{resp.status_code}] Server error for URL: {url}. Retrying in {wait:.2f}s (attempt {attempt+1}/{max_retries})")
+                    metrics.observe_retry(method, "5xx")
+                    error_class = classify_status(resp.status_code)
+                    time.sleep(wait)
+                    metrics.observe_sleep("backoff", wait)
+                    continue
+
+                resp.raise_for_status()
+                if use_cache:
+                    self.cache.put(method, url, params, resp.content)
+                return resp
+
+            except (ConnectionError, ProtocolError, ReadTimeoutError) as e:
+                wait = exponential_backoff(attempt)
+                logging.warning(f"Connection error ({type(e).__name__}) for URL: {url}. Retrying in {wait:.2f}s (attempt {attempt+1}/{max_retries})")
+                metrics.observe_retry(method, "connection")
+                error_class = ERROR_NETWORK
+                time.sleep(wait)
+                metrics.observe_sleep("backoff", wait)
+
+            except Timeout as e:
+                wait = exponential_backoff(attempt, base=2)
+                logging.warning(f"Timeout ({type(e).__name__}) for URL: {url}. Retrying in {wait:.2f}s (attempt {attempt+1}/{max_retries})")
+                metrics.observe_retry(method, "timeout")
+                error_class = ERROR_NETWORK
+                time.sleep(wait)
+                metrics.observe_sleep("backoff", wait)
+
+            except HTTPError as e:
+                status_code = getattr(e.response, 'status_code', None)
+                logging.error(f"HTTP error {status_code or 'unknown'} for URL: {url}")
+                return FailedFetch(classify_status(status_code), f"HTTP {status_code or 'error'}")
+
+            except Exception as e:
+                logging.error(f"Unexpected error ({type(e).__name__}: {str(e)}) for URL: {url}")
+                error_class = ERROR_UNKNOWN
+                if attempt == max_retries - 1:
+                    return FailedFetch(error_class, f"{type(e).__name__}: {str(e)}")
+
+                wait = exponential_backoff(attempt, base=3)
+                metrics.observe_retry(method, "unexpected")
+                time.sleep(wait)
+                metrics.observe_sleep("backoff", wait)
+
+        logging.error(f"Max retries exceeded for URL: {url}")
+        return FailedFetch(error_class, "max retries exceeded")
+
+    def league_entries(self, platform: str, queue: str, tier: str, division: str, page: int = 1):
+        url = f"{self.route_url(platform)}/lol/league-exp/v4/entries/{queue}/{tier}/{division}"
+        return self.fetch_respecting_headers(url, params={"page": page}, method=METHOD_LEAGUE_ENTRIES,
+                                             route=platform)
+
+    def match_ids(self, region: str, puuid: str, start: int = 0, count: int = 20, start_time: Optional[int] = None):
+        # Newest first; start_time (epoch seconds) leaves out games that started before it.
+        url = f"{self.route_url(region)}/lol/match/v5/matches/by-puuid/{puuid}/ids"
+        params = {"queue": 420, "type": "ranked", "start": start, "count": count}
+        if start_time is not None:
+            params["startTime"] = start_time
+        return self.fetch_respecting_headers(url, params=params, method=METHOD_MATCH_IDS, route=region)
+
+    def match(self, region: str, match_id: str):
+        url = f"{self.route_url(region)}/lol/match/v5/matches/{match_id}"
+        return self.fetch_respecting_headers(url, method=METHOD_MATCH, route=region)
+
+    def timeline(self, region: str, match_id: str):
+        url = f"{self.route_url(region)}/lol/match/v5/matches/{match_id}/timeline"
+        return self.fetch_respecting_headers(url, method=METHOD_TIMELINE, route=region)
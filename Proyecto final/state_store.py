@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+STATUS_PENDING = "pending"
+STATUS_FETCHED = "fetched"
+STATUS_FAILED = "failed"
+STATUS_ABANDONED = "abandoned"
+
+
+class PlayerCursor(NamedTuple):
+    # Where the last match ID crawl of a player stopped. recent_games and
+    # recent_days are exponentially decayed totals of the new games found and
+    # the days covered by earlier crawls; their ratio is the player's play rate.
+    puuid: str
+    platform: Optional[str]
+    crawled_at: Optional[float]
+    newest_match_id: Optional[str]
+    recent_games: Optional[float]
+    recent_days: Optional[float]
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    puuid TEXT PRIMARY KEY,
+    added_at REAL NOT NULL,
+    platform TEXT,
+    crawled_at REAL,
+    newest_match_id TEXT,
+    recent_games REAL,
+    recent_days REAL
+);
+CREATE TABLE IF NOT EXISTS matches (
+    match_id TEXT PRIMARY KEY,
+    region TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    error_class TEXT,
+    next_attempt_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS matches_by_status ON matches (status);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Columns added after the first release; databases created before get them on open.
+ADDED_COLUMNS = [("players", "platform", "TEXT"), ("matches", "region", "TEXT"),
+                 ("matches", "error_class", "TEXT"), ("matches", "next_attempt_at", "REAL"),
+                 ("players", "crawled_at", "REAL"), ("players", "newest_match_id", "TEXT"),
+                 ("players", "recent_games", "REAL"), ("players", "recent_days", "REAL")]
+CURSOR_COLUMNS = "puuid, platform, crawled_at, newest_match_id, recent_games, recent_days"
+
+# Created after ADDED_COLUMNS so older databases already have the indexed columns.
+INDEXES = """
+CREATE INDEX IF NOT EXISTS matches_by_retry ON matches (status, region, next_attempt_at);
+"""
+
+
+class CrawlState:
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        for table, column, kind in ADDED_COLUMNS:
+            columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+        self.conn.executescript(INDEXES)
+        self.conn.commit()
+
+    def add_players(self, puuids: Iterable[str], platform: Optional[str] = None) -> List[str]:
+        return self._insert_new("INSERT OR IGNORE INTO players (puuid, added_at, platform) VALUES (?, ?, ?)",
+                                puuids, platform)
+
+    def players(self) -> List[Tuple[str, Optional[str]]]:
+        with self.lock:
+            return self.conn.execute("SELECT puuid, platform FROM players ORDER BY rowid").fetchall()
+
+    def player_cursors(self) -> List[PlayerCursor]:
+        with self.lock:
+            rows = self.conn.execute(f"SELECT {CURSOR_COLUMNS} FROM players ORDER BY rowid").fetchall()
+        return [PlayerCursor(*row) for row in rows]
+
+    def player_cursor(self, puuid: str) -> Optional[PlayerCursor]:
+        with self.lock:
+            row = self.conn.execute(f"SELECT {CURSOR_COLUMNS} FROM players WHERE puuid = ?", (puuid,)).fetchone()
+        return PlayerCursor(*row) if row else None
+
+    def update_player_cursor(self, puuid: str, crawled_at: float, newest_match_id: Optional[str],
+                             recent_games: Optional[float], recent_days: Optional[float]) -> None:
+        with self.lock:
+            self.conn.execute(
+                "UPDATE players SET crawled_at = ?, newest_match_id = ?, recent_games = ?, recent_days = ? "
+                "WHERE puuid = ?", (crawled_at, newest_match_id, recent_games, recent_days, puuid))
+
+    def player_count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM players").fetchone()[0]
+
+    def add_match_ids(self, match_ids: Iterable[str], region: Optional[str] = None) -> List[str]:
+        return self._insert_new("INSERT OR IGNORE INTO matches (match_id, updated_at, region) VALUES (?, ?, ?)",
+                                match_ids, region)
+
+    def pending_matches(self) -> List[Tuple[str, Optional[str]]]:
+        with self.lock:
+            return self.conn.execute("SELECT match_id, region FROM matches WHERE status = ? ORDER BY rowid",
+                                     (STATUS_PENDING,)).fetchall()
+
+    def tag_untagged(self, platform: str, region: str) -> None:
+        # Rows collected before platforms were tracked all came from a single platform.
+        with self.lock:
+            self.conn.execute("UPDATE players SET platform = ? WHERE platform IS NULL", (platform,))
+            self.conn.execute("UPDATE matches SET region = ? WHERE region IS NULL", (region,))
+            self.conn.commit()
+
+    def mark_fetched(self, match_ids: Iterable[str]) -> None:
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE matches SET status = ?, attempts = attempts + 1, last_error = NULL, error_class = NULL, "
+                "next_attempt_at = NULL, updated_at = ? WHERE match_id = ?",
+                ((STATUS_FETCHED, now, match_id) for match_id in match_ids))
+
+    def mark_failed(self, match_id: str, error: Optional[str] = None, error_class: Optional[str] = None,
+                    next_attempt_at: Optional[float] = None, permanent: bool = False) -> None:
+        # Like every other write this lands in the open transaction, which the
+        # collector commits every CHECKPOINT_FREQ matches.
+        with self.lock:
+            self.conn.execute(
+                "UPDATE matches SET status = ?, attempts = attempts + 1, last_error = ?, error_class = ?, "
+                "next_attempt_at = ?, updated_at = ? WHERE match_id = ?",
+                (STATUS_ABANDONED if permanent else STATUS_FAILED, error, error_class,
+                 None if permanent else next_attempt_at, time.time(), match_id))
+
+    def match_attempts(self, match_id: str) -> int:
+        with self.lock:
+            row = self.conn.execute("SELECT attempts FROM matches WHERE match_id = ?", (match_id,)).fetchone()
+        return row[0] if row else 0
+
+    def due_retries(self, region: str, now: float, limit: Optional[int] = None) -> List[str]:
+        # Failures without a next attempt time (e.g. migrated ones) are due right away.
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT match_id FROM matches WHERE status = ? AND region = ? AND COALESCE(next_attempt_at, 0) <= ? "
+                "ORDER BY COALESCE(next_attempt_at, 0) LIMIT ?",
+                (STATUS_FAILED, region, now, -1 if limit is None else limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def failure_counts(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.conn.execute(
+                "SELECT COALESCE(error_class, 'unknown'), COUNT(*) FROM matches WHERE status IN (?, ?) "
+                "GROUP BY error_class", (STATUS_FAILED, STATUS_ABANDONED)))
+
+    def match_counts(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM matches GROUP BY status"))
+
+    def commit(self) -> None:
+        with self.lock:
+            self.conn.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+    def __enter__(self) -> "CrawlState":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def migrate_from_json(self, players_file: str, games_file: str, failed_file: str) -> bool:
+        with self.lock:
+            if self.conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return False
+
+            players = self._read_json_list(players_file)
+            games = self._read_json_list(games_file)
+            failed = self._read_json_list(failed_file)
+
+            new_players = self.add_players(players)
+            new_matches = self.add_match_ids(games + failed)
+            for match_id in failed:
+                self.mark_failed(match_id, "migrated")
+
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+                              (str(time.time()),))
+            self.conn.commit()
+
+        if players or games or failed:
+            logging.info(f"Migrated {len(new_players)} players, {len(new_matches)} match IDs "
+                         f"({len(failed)} failed) from JSON checkpoints into {self.db_path}")
+        return True
+
+    def _insert_new(self, sql: str, keys: Iterable[str], tag: Optional[str] = None) -> List[str]:
+        now = time.time()
+        with self.lock:
+            return [key for key in keys if self.conn.execute(sql, (key, now, tag)).rowcount]
+
+    @staticmethod
+    def _read_json_list(file_path: str) -> List:
+        if not os.path.exists(file_path):
+            return []
+        try:
+            with open(file_path) as f:
+                data = json.load(f)
+        except json.JSONDecodeError:
+            logging.warning(f"Couldn't parse JSON from {file_path}, skipping migration of it")
+            return []
+        return data if isinstance(data, list) else []
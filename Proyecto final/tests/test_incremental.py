@@ -0,0 +1,56 @@
+import json
+
+import numpy as np
+import pyarrow.dataset as ds
+import pytest
+
+import data_processor
+from champion_stats import ChampionStats
+from config import CHAMPION_STATS_FILE, MATCHES_OUTPUT
+from mock_riot_api import synthetic_match
+from training_export import iter_shards
+
+GAMES = 300
+
+
+def write_ndjson(path, game_numbers):
+    with open(path, "w") as f:
+        f.writelines(json.dumps(synthetic_match(game_number)) + "\n" for game_number in game_numbers)
+
+
+def stored_game_ids():
+    return ds.dataset(MATCHES_OUTPUT, format="parquet", partitioning="hive").to_table(
+        columns=["gameId"]).column("gameId").to_numpy()
+
+
+@pytest.mark.parametrize("workers", [1, 2, 3])
+def test_repeated_game_is_stored_once(tmp_path, monkeypatch, workers):
+    # Game 5 is repeated at the end of the input, so with several workers the
+    # two copies fall into different byte ranges.
+    monkeypatch.chdir(tmp_path)
+    write_ndjson("matches.ndjson", list(range(1, GAMES + 1)) + [5])
+    data_processor.main(["--input", "matches.ndjson", "--incremental", "--workers", str(workers),
+                         "--export-training", "training"])
+
+    game_ids = stored_game_ids()
+    assert len(game_ids) == 2 * GAMES
+    assert len(np.unique(game_ids)) == GAMES
+    committed = np.fromfile(f"{MATCHES_OUTPUT}/{data_processor.GAME_IDS_FILE}", dtype=data_processor.GAME_ID_DTYPE)
+    assert sorted(committed.tolist()) == sorted(np.unique(game_ids).tolist())
+    assert int(ChampionStats.load(CHAMPION_STATS_FILE).counts["games"].sum()) == GAMES
+    exported = np.concatenate([shard["game_ids"] for shard in iter_shards("training")])
+    assert len(exported) == GAMES and len(np.unique(exported)) == GAMES
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_processed_games_are_not_appended_again(tmp_path, monkeypatch, workers):
+    monkeypatch.chdir(tmp_path)
+    write_ndjson("first.ndjson", range(1, 201))
+    data_processor.main(["--input", "first.ndjson", "--incremental", "--workers", str(workers)])
+    write_ndjson("second.ndjson", range(151, GAMES + 1))
+    data_processor.main(["--input", "second.ndjson", "--incremental", "--workers", str(workers)])
+
+    game_ids = stored_game_ids()
+    assert len(game_ids) == 2 * GAMES
+    assert len(np.unique(game_ids)) == GAMES
+    assert int(ChampionStats.load(CHAMPION_STATS_FILE).counts["games"].sum()) == GAMES
@@ -1,116 +1,47 @@
 import logging
 import json
-import requests
-import time
 import os
-import random
-from requests import Session, HTTPError, ConnectionError, Timeout, TooManyRedirects
-from urllib3.exceptions import ProtocolError, ReadTimeoutError
-from tqdm import tqdm
+import argparse
 
 from config import (
-    API_KEY, THRESHOLD, PAUSE_BETW, CHECKPOINT_FREQ, MAX_RETRIES, BASE_TIMEOUT,
-    PLAYERS_FILE, GAMES_FILE, TIMELINE_FILE, FAILED_MATCHES_FILE,
-    QUEUES, TIERS, DIVISIONS
+    FETCH_TIMELINES, LEAGUE_WORKERS, MATCH_ID_WORKERS, MATCH_WORKERS, RETRY_WORKERS,
+    PLAYERS_FILE, GAMES_FILE, TIMELINE_FILE, FAILED_MATCHES_FILE, RAW_STORE_DIR, STATE_DB_FILE,
+    TIMELINE_STORE_DIR, CACHE_DIR, CACHE_MAX_BYTES, CACHE_TTL_SECONDS,
+    API_URL, PLATFORMS, PLATFORM_ROUTING, LEGACY_PLATFORM,
+    METRICS_FILE, METRICS_SUMMARY_FILE, METRICS_INTERVAL
 )
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("riot_api.log"),
-        logging.StreamHandler()
-    ]
-)
+# Importing this module has no side effects: logging, the HTTP client and the
+# crawl state are only set up by main(). The reusable parts live in
+# riot_client.py (RiotClient) and collector_stages.py (one class per stage).
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-players_file   = os.path.join(BASE_DIR, PLAYERS_FILE)
-games_file     = os.path.join(BASE_DIR, GAMES_FILE)
-timeline_file  = os.path.join(BASE_DIR, TIMELINE_FILE)
-failed_matches_file = os.path.join(BASE_DIR, FAILED_MATCHES_FILE)
-
-adapter = requests.adapters.HTTPAdapter(
-    max_retries=0,
-    pool_connections=10,
-    pool_maxsize=20
-)
-
-session = Session()
-session.mount('https://', adapter)
-session.headers.update({
-    "X-Riot-Token": API_KEY,
-    "User-Agent": "MyLoLTool/1.0 (https://github.com/you/mytool; you@example.com)",
-    "Accept-Encoding": "gzip",
-})
-
-def parse_header_pairs(header_val: str):
-    pairs = []
-    if not header_val:
-        return pairs
-    for chunk in header_val.split(","):
-        limit, window = map(int, chunk.split(":"))
-        pairs.append((limit, window))
-    return pairs
-
-def exponential_backoff(attempt, base=1, max_backoff=60):
-    delay = min(max_backoff, base * (2 ** attempt))
-    jitter = random.uniform(0, 0.1 * delay)
-    return delay + jitter
-
-def fetch_respecting_headers(url, params=None, max_retries=MAX_RETRIES):
-    for attempt in range(max_retries):
-        try:
-            timeout = BASE_TIMEOUT * (1 + attempt * 0.5)
-            
-            resp = session.get(url, params=params, timeout=timeout)
-            
-            if resp.status_code == 429:
-                app_limits = parse_header_pairs(resp.headers.get("X-App-Rate-Limit", ""))
-                app_counts = parse_header_pairs(resp.headers.get("X-App-Rate-Limit-Count", ""))
-                
-                if "Retry-After" in resp.headers:
-                    wait = int(resp.headers["Retry-After"])
-                else:
-                    violated = [w for (L, w), (c, _) in zip(app_limits, app_counts) if c >= L]
-                    wait = max(violated) if violated else 1
-                
-                logging.warning(f"[429] Rate limited. Sleeping {wait}s (attempt {attempt+1}/{max_retries})")
-                time.sleep(wait)
-                continue
-                
-            elif 500 <= resp.status_code < 600:
-                wait = exponential_backoff(attempt)
-                logging.warning(f"[{resp.status_code}] Server error for URL: {url}. Retrying in {wait:.2f}s (attempt {attempt+1}/{max_retries})")
-                time.sleep(wait)
-                continue
-            
-            resp.raise_for_status()
-            return resp
-            
-        except (ConnectionError, ProtocolError, ReadTimeoutError) as e:
-            wait = exponential_backoff(attempt)
-            logging.warning(f"Connection error ({type(e).__name__}) for URL: {url}. Retrying in {wait:.2f}s (attempt {attempt+1}/{max_retries})")
-            time.sleep(wait)
-            
-        except Timeout as e:
-            wait = exponential_backoff(attempt, base=2)
-            logging.warning(f"Timeout ({type(e).__name__}) for URL: {url}. Retrying in {wait:.2f}s (attempt {attempt+1}/{max_retries})")
-            time.sleep(wait)
-            
-        except HTTPError as e:
-            logging.error(f"HTTP error {getattr(e.response, 'status_code', 'unknown')} for URL: {url}")
-            return None
-            
-        except Exception as e:
-            logging.error(f"Unexpected error ({type(e).__name__}: {str(e)}) for URL: {url}")
-            if attempt == max_retries - 1:
-                return None
-            
-            wait = exponential_backoff(attempt, base=3)
-            time.sleep(wait)
-    
-    logging.error(f"Max retries exceeded for URL: {url}")
-    return None
+STAGES = ["players", "match-ids", "matches"]
+LOG_FILE = "riot_api.log"
+
+def data_paths(data_dir=BASE_DIR):
+    return {
+        "players_file":         os.path.join(data_dir, PLAYERS_FILE),
+        "games_file":           os.path.join(data_dir, GAMES_FILE),
+        "timeline_file":        os.path.join(data_dir, TIMELINE_FILE),
+        "failed_matches_file":  os.path.join(data_dir, FAILED_MATCHES_FILE),
+        "raw_store_dir":        os.path.join(data_dir, RAW_STORE_DIR),
+        "state_db_file":        os.path.join(data_dir, STATE_DB_FILE),
+        "timeline_store_dir":   os.path.join(data_dir, TIMELINE_STORE_DIR),
+        "cache_dir":            os.path.join(data_dir, CACHE_DIR),
+        "metrics_file":         os.path.join(data_dir, METRICS_FILE),
+        "metrics_summary_file": os.path.join(data_dir, METRICS_SUMMARY_FILE),
+    }
+
+def setup_logging(log_file=LOG_FILE):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(log_file),
+            logging.StreamHandler()
+        ]
+    )
 
 def load_or_create_file(file_path, default=None):
     if default is None:
@@ -130,120 +61,97 @@ def load_or_create_file(file_path, default=None):
         logging.warning(f"Couldn't parse JSON from {file_path}, creating new file")
         return default
 
-def save_checkpoint(file_path, data):
-    try:
-        temp_path = file_path + ".tmp"
-        with open(temp_path, "w") as f:
-            json.dump(data, f)
-        
-        os.replace(temp_path, file_path)
-        return True
-    except Exception as e:
-        logging.error(f"Failed to save checkpoint to {file_path}: {str(e)}")
-        return False
-
-players_puuids = load_or_create_file(players_file)
-failed_matches = load_or_create_file(failed_matches_file)
-combos = [(q, t, d) for q in QUEUES for t in TIERS for d in DIVISIONS]
+def write_final_metrics(metrics, metrics_file, metrics_summary_file):
+    metrics.stop_exporter()
+    metrics.write_prometheus(metrics_file)
+    metrics.write_summary(metrics_summary_file)
+    logging.info(f"Metrics written to {metrics_file} and {metrics_summary_file}")
 
-try:
-    with tqdm(combos, desc="Fetching league entries", unit="req", 
-              bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]") as pbar:
-        for i, (queue, tier, division) in enumerate(pbar):
-            pbar.set_description(f"Fetching {tier} {division}")
-            url = f"https://kr.api.riotgames.com/lol/league-exp/v4/entries/{queue}/{tier}/{division}"
-            resp = fetch_respecting_headers(url, params={"page": 1})
-            if not resp:
-                logging.warning(f"Failed to fetch {tier} {division}, continuing to next")
-                continue
-                
-            try:
-                entries = resp.json()
-                for p in entries:
-                    if "puuid" in p and p["puuid"] not in players_puuids:
-                        players_puuids.append(p["puuid"])
-            except (ValueError, KeyError) as e:
-                logging.error(f"Error parsing response: {str(e)}")
-                
-            pbar.set_postfix(players=len(players_puuids))
-            
-            if (i + 1) % CHECKPOINT_FREQ == 0 or i == len(combos) - 1:
-                save_checkpoint(players_file, players_puuids)
-                    
-            time.sleep(PAUSE_BETW)
-except KeyboardInterrupt:
-    logging.info("Process interrupted by user during player fetching")
-    save_checkpoint(players_file, players_puuids)
-    raise
-
-latest_games = load_or_create_file(games_file)
-stored_puuids = load_or_create_file(players_file)
-
-try:
-    with tqdm(stored_puuids, desc="Fetching match IDs", unit="player", 
-              bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]") as pbar:
-        for i, puuid in enumerate(pbar):
-            url = f"https://asia.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids"
-            resp = fetch_respecting_headers(url, params={"queue": 420, "type": "ranked", "start": 0, "count": 20})
-            if not resp:
-                continue
-                
-            try:
-                new_matches = [m for m in resp.json() if m not in latest_games]
-                latest_games.extend(new_matches)
-            except (ValueError, KeyError) as e:
-                logging.error(f"Error parsing matches for puuid {puuid}: {str(e)}")
-                continue
-            
-            pbar.set_postfix(total_matches=len(latest_games), new_matches=len(new_matches))
-            
-            if (i + 1) % CHECKPOINT_FREQ == 0 or i == len(stored_puuids) - 1:
-                save_checkpoint(games_file, latest_games)
-                    
-            time.sleep(PAUSE_BETW)
-except KeyboardInterrupt:
-    logging.info("Process interrupted by user during match ID fetching")
-    save_checkpoint(games_file, latest_games)
-    raise
-
-matches_info = load_or_create_file(timeline_file)
-stored_games = load_or_create_file(games_file)
-
-processed_matches = {m.get("metadata", {}).get("matchId") for m in matches_info if "metadata" in m}
-unprocessed_games = [match_id for match_id in stored_games if match_id not in processed_matches and match_id not in failed_matches]
-
-try:
-    with tqdm(unprocessed_games, desc="Fetching match data", unit="match",
-              bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]") as pbar:
-        for i, match_id in enumerate(pbar):
-            pbar.set_description(f"Match {match_id}")
-            url = f"https://asia.api.riotgames.com/lol/match/v5/matches/{match_id}"
-            resp = fetch_respecting_headers(url)
-            
-            if not resp:
-                logging.warning(f"Failed to fetch match {match_id}, adding to failed matches list")
-                failed_matches.append(match_id)
-                save_checkpoint(failed_matches_file, failed_matches)
-                continue
-                
-            try:
-                match_data = resp.json()
-                matches_info.append(match_data)
-            except (ValueError, KeyError) as e:
-                logging.error(f"Error parsing match data for {match_id}: {str(e)}")
-                failed_matches.append(match_id)
-                save_checkpoint(failed_matches_file, failed_matches)
-                continue
-            
-            approx_size_mb = sum(len(json.dumps(m)) for m in matches_info) / (1024 * 1024)
-            pbar.set_postfix(matches=len(matches_info), failed=len(failed_matches), size_mb=f"{approx_size_mb:.1f}MB")
-            
-            if (i + 1) % CHECKPOINT_FREQ == 0 or i == len(unprocessed_games) - 1:
-                save_checkpoint(timeline_file, matches_info)
-                    
-            time.sleep(PAUSE_BETW)
-except KeyboardInterrupt:
-    logging.info("Process interrupted by user during match data fetching")
-    save_checkpoint(timeline_file, matches_info)
-    save_checkpoint(failed_matches_file, failed_matches)
-    print("Process interrupted. Progress has been saved.")
\ No newline at end of file
+def migrate_timeline_file(file_path, store):
+    if len(store) > 0 or not os.path.exists(file_path):
+        return 0
+    
+    migrated = 0
+    for match in load_or_create_file(file_path):
+        match_id = match.get("metadata", {}).get("matchId")
+        if match_id and store.append(match_id, match):
+            migrated += 1
+    logging.info(f"Migrated {migrated} matches from {file_path} into {store.directory}")
+    return migrated
+
+def stage_names(stage):
+    return STAGES if stage == "all" else [stage]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Collect high elo ranked matches from the Riot API")
+    parser.add_argument("stage", nargs="?", choices=STAGES + ["all"], default="all",
+                        help="Run one stage on its own (players, match-ids, matches) or all of them together")
+    parser.add_argument("--offline", action="store_true",
+                        help="Serve every request from the response cache and never call the API")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor write the response cache")
+    parser.add_argument("--data-dir", default=BASE_DIR, help="Directory for the crawl state, stores, cache and metrics")
+    parser.add_argument("--platforms", nargs="+", default=PLATFORMS, choices=sorted(PLATFORM_ROUTING),
+                        help="Platforms to crawl; their regions are crawled at the same time")
+    parser.add_argument("--api-url", default=API_URL,
+                        help="Base URL of the API, {route} is replaced by the platform or region")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.offline and args.no_cache:
+        raise SystemExit("--offline needs the response cache, it can't be combined with --no-cache")
+    setup_logging()
+    
+    # Imported here so --help and library users don't pay for requests and tqdm.
+    from collector_stages import CrawlContext, build_stages, run_stages
+    from http_cache import ResponseCache
+    from metrics import CollectorMetrics
+    from raw_store import RawMatchStore
+    from riot_client import RiotClient
+    from state_store import CrawlState
+    
+    stages = stage_names(args.stage)
+    paths = data_paths(args.data_dir)
+    # Enough connections for every worker even when all routes share one host (e.g. the mock API).
+    region_count = len({PLATFORM_ROUTING[platform] for platform in args.platforms})
+    pool_size = (LEAGUE_WORKERS * len(args.platforms) * ("players" in stages)
+                 + MATCH_ID_WORKERS * region_count * ("match-ids" in stages)
+                 + (MATCH_WORKERS + RETRY_WORKERS) * region_count * ("matches" in stages))
+    cache = None if args.no_cache else ResponseCache(paths["cache_dir"], CACHE_MAX_BYTES, CACHE_TTL_SECONDS)
+    if args.offline:
+        logging.info(f"Offline mode: replaying responses from {paths['cache_dir']}")
+    
+    metrics = CollectorMetrics()
+    client = RiotClient(api_url=args.api_url, cache=cache, offline=args.offline, metrics=metrics,
+                        pool_size=pool_size)
+    metrics.start_exporter(paths["metrics_file"], METRICS_INTERVAL)
+    state = CrawlState(paths["state_db_file"])
+    raw_store = None
+    timeline_store = None
+    try:
+        state.migrate_from_json(paths["players_file"], paths["games_file"], paths["failed_matches_file"])
+        state.tag_untagged(LEGACY_PLATFORM, PLATFORM_ROUTING[LEGACY_PLATFORM])
+        if "matches" in stages:
+            raw_store = RawMatchStore(paths["raw_store_dir"])
+            migrate_timeline_file(paths["timeline_file"], raw_store)
+            if FETCH_TIMELINES:
+                from timeline_store import TimelineStore
+                timeline_store = TimelineStore(paths["timeline_store_dir"])
+        context = CrawlContext(client, state, raw_store, timeline_store, args.platforms)
+        run_stages(context, build_stages(context, stages))
+    except KeyboardInterrupt:
+        logging.info("Process interrupted by user")
+        print("Process interrupted. Progress has been saved.")
+    finally:
+        if raw_store is not None:
+            raw_store.close()
+        if timeline_store is not None:
+            logging.info(f"{len(timeline_store)} timelines stored in {paths['timeline_store_dir']}")
+        state.close()
+        client.close()
+        if cache is not None:
+            cache.close()
+        write_final_metrics(metrics, paths["metrics_file"], paths["metrics_summary_file"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+PARTICIPANTS = 10
+
+FRAME_FIELDS = [
+    "totalGold", "currentGold", "xp", "level", "minionsKilled", "jungleMinionsKilled",
+    "positionX", "positionY", "totalDamageDoneToChampions", "totalDamageTaken",
+]
+
+EVENT_TYPES = [
+    "CHAMPION_KILL", "CHAMPION_SPECIAL_KILL", "ELITE_MONSTER_KILL", "BUILDING_KILL",
+    "TURRET_PLATE_DESTROYED", "WARD_PLACED", "WARD_KILL", "ITEM_PURCHASED", "ITEM_SOLD",
+    "ITEM_DESTROYED", "ITEM_UNDO", "SKILL_LEVEL_UP", "LEVEL_UP", "DRAGON_SOUL_GIVEN",
+    "CHAMPION_TRANSFORM", "OBJECTIVE_BOUNTY_PRESTART", "OBJECTIVE_BOUNTY_FINISH",
+    "FEAT_UPDATE", "PAUSE_END", "GAME_END",
+]
+EVENT_TYPE_OTHER = 255
+EVENT_TYPE_CODES = {name: code for code, name in enumerate(EVENT_TYPES)}
+
+EVENT_COLUMNS = {
+    "match": np.dtype("<i4"),
+    "timestamp": np.dtype("<i4"),
+    "type": np.dtype("u1"),
+    "participant": np.dtype("i1"),
+    "victim": np.dtype("i1"),
+    "x": np.dtype("<i2"),
+    "y": np.dtype("<i2"),
+    "value": np.dtype("<i4"),
+}
+
+FRAME_DTYPE = np.dtype("<i4")
+INDEX_DTYPE = np.dtype([
+    ("game_id", "<i8"),
+    ("frame_start", "<i8"),
+    ("frame_count", "<i4"),
+    ("frame_interval", "<i4"),
+    ("event_start", "<i8"),
+    ("event_count", "<i4"),
+])
+
+FRAMES_FILE = "frames.i32"
+INDEX_FILE = "index.bin"
+MATCH_IDS_FILE = "match_ids.txt"
+
+
+class TimelineStore:
+    # Per-minute participant frames live in one flat int32 file laid out as
+    # frames x participants x FRAME_FIELDS; the index row of each match says
+    # where its frames and events start, so readers only need np.memmap.
+
+    def __init__(self, directory: str, readonly: bool = False):
+        self.directory = directory
+        self.readonly = readonly
+        self.lock = threading.Lock()
+        self.frames_path = os.path.join(directory, FRAMES_FILE)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.match_ids_path = os.path.join(directory, MATCH_IDS_FILE)
+        self.match_ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.frame_count = 0
+        self.event_count = 0
+
+        if not readonly:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def __contains__(self, match_id: str) -> bool:
+        return match_id in self.rows
+
+    def __len__(self) -> int:
+        return len(self.match_ids)
+
+    def event_path(self, column: str) -> str:
+        return os.path.join(self.directory, f"events.{column}.{EVENT_COLUMNS[column].str.lstrip('<|')}")
+
+    def append(self, match_id: str, timeline: Dict) -> int:
+        if self.readonly:
+            raise IOError(f"Timeline store {self.directory} was opened read-only")
+
+        info = timeline.get("info", {})
+        frames = self.encode_frames(info.get("frames", []))
+
+        with self.lock:
+            if match_id in self.rows:
+                return 0
+
+            match_row = len(self.match_ids)
+            events = self.encode_events(info.get("frames", []), match_row)
+
+            with open(self.frames_path, "ab") as f:
+                frames.tofile(f)
+            for column, values in events.items():
+                with open(self.event_path(column), "ab") as f:
+                    values.tofile(f)
+
+            row = np.zeros(1, dtype=INDEX_DTYPE)
+            row["game_id"] = info.get("gameId") or 0
+            row["frame_start"] = self.frame_count
+            row["frame_count"] = len(frames)
+            row["frame_interval"] = info.get("frameInterval") or 0
+            row["event_start"] = self.event_count
+            row["event_count"] = len(events["match"])
+
+            # The match id line is written last and marks the record as complete.
+            with open(self.index_path, "ab") as f:
+                row.tofile(f)
+            with open(self.match_ids_path, "a", encoding="utf-8") as f:
+                f.write(match_id + "\n")
+
+            self.match_ids.append(match_id)
+            self.rows[match_id] = match_row
+            self.frame_count += len(frames)
+            self.event_count += len(events["match"])
+        return frames.nbytes + sum(values.nbytes for values in events.values())
+
+    @staticmethod
+    def encode_frames(frames: List[Dict]) -> np.ndarray:
+        encoded = np.zeros((len(frames), PARTICIPANTS, len(FRAME_FIELDS)), dtype=FRAME_DTYPE)
+        for frame_number, frame in enumerate(frames):
+            for key, participant in (frame.get("participantFrames") or {}).items():
+                slot = int(key) - 1
+                if not 0 <= slot < PARTICIPANTS or not isinstance(participant, dict):
+                    continue
+                position = participant.get("position") or {}
+                damage = participant.get("damageStats") or {}
+                values = (
+                    participant.get("totalGold"), participant.get("currentGold"), participant.get("xp"),
+                    participant.get("level"), participant.get("minionsKilled"),
+                    participant.get("jungleMinionsKilled"), position.get("x"), position.get("y"),
+                    damage.get("totalDamageDoneToChampions"), damage.get("totalDamageTaken"),
+                )
+                encoded[frame_number, slot] = [value or 0 for value in values]
+        return encoded
+
+    @staticmethod
+    def encode_events(frames: List[Dict], match_row: int) -> Dict[str, np.ndarray]:
+        rows = []
+        for frame in frames:
+            for event in frame.get("events") or []:
+                position = event.get("position") or {}
+                value = next((event[key] for key in ("itemId", "skillSlot", "level", "bounty", "killStreakLength")
+                              if event.get(key) is not None), 0)
+                rows.append((
+                    match_row,
+                    event.get("timestamp") or 0,
+                    EVENT_TYPE_CODES.get(event.get("type"), EVENT_TYPE_OTHER),
+                    event.get("participantId") or event.get("killerId") or event.get("creatorId") or 0,
+                    event.get("victimId") or 0,
+                    position.get("x") or 0,
+                    position.get("y") or 0,
+                    value,
+                ))
+
+        columns = list(zip(*rows)) if rows else [()] * len(EVENT_COLUMNS)
+        return {name: np.array(values, dtype=dtype) for (name, dtype), values in zip(EVENT_COLUMNS.items(), columns)}
+
+    def index(self) -> np.ndarray:
+        if not os.path.exists(self.index_path):
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        return np.fromfile(self.index_path, dtype=INDEX_DTYPE, count=len(self.match_ids))
+
+    def frames(self) -> np.ndarray:
+        if self.frame_count == 0:
+            return np.zeros((0, PARTICIPANTS, len(FRAME_FIELDS)), dtype=FRAME_DTYPE)
+        return np.memmap(self.frames_path, dtype=FRAME_DTYPE, mode="r",
+                         shape=(self.frame_count, PARTICIPANTS, len(FRAME_FIELDS)))
+
+    def events(self) -> Dict[str, np.ndarray]:
+        if self.event_count == 0:
+            return {name: np.zeros(0, dtype=dtype) for name, dtype in EVENT_COLUMNS.items()}
+        return {name: np.memmap(self.event_path(name), dtype=dtype, mode="r", shape=(self.event_count,))
+                for name, dtype in EVENT_COLUMNS.items()}
+
+    def match_frames(self, match_id: str) -> Optional[np.ndarray]:
+        if match_id not in self.rows:
+            return None
+        row = self.index()[self.rows[match_id]]
+        start = int(row["frame_start"])
+        return self.frames()[start:start + int(row["frame_count"])]
+
+    def _load(self) -> None:
+        if os.path.exists(self.match_ids_path):
+            with open(self.match_ids_path, "rb") as f:
+                content = f.read()
+            complete = content.rfind(b"\n") + 1
+            self.match_ids = content[:complete].decode("utf-8").splitlines()
+
+        index = self.index()
+        self.match_ids = self.match_ids[:len(index)]
+        self.rows = {match_id: row for row, match_id in enumerate(self.match_ids)}
+        if len(index):
+            last = index[-1]
+            self.frame_count = int(last["frame_start"] + last["frame_count"])
+            self.event_count = int(last["event_start"] + last["event_count"])
+
+        if not self.readonly:
+            self._truncate_to(self.match_ids_path, sum(len(m.encode("utf-8")) + 1 for m in self.match_ids))
+            self._truncate_to(self.index_path, len(self.match_ids) * INDEX_DTYPE.itemsize)
+            frame_bytes = PARTICIPANTS * len(FRAME_FIELDS) * FRAME_DTYPE.itemsize
+            self._truncate_to(self.frames_path, self.frame_count * frame_bytes)
+            for name, dtype in EVENT_COLUMNS.items():
+                self._truncate_to(self.event_path(name), self.event_count * dtype.itemsize)
+
+    @staticmethod
+    def _truncate_to(path: str, size: int) -> None:
+        # Anything past the last complete record was left by an interrupted append.
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            with open(path, "r+b") as f:
+                f.truncate(size)
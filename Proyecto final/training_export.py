@@ -0,0 +1,248 @@
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from champion_stats import BAN_COLUMNS, POSITIONS, UNKNOWN_POSITION, iter_dataset_games
+from config import TRAINING_CHAMPION_SLOTS, TRAINING_PLAYER_AGGREGATES, TRAINING_TEAM_COLUMNS
+
+# One row per game. Side 0 is blue (teamId 100), side 1 is red (teamId 200),
+# and the label is whether blue won. Each side has one one-hot block of picks
+# per position (plus one for players without a teamPosition) and one of bans.
+SIDES = ["blue", "red"]
+TEAM_IDS = [100, 200]
+PICK_BLOCKS = POSITIONS + ["NONE"]
+BLOCKS_PER_SIDE = len(PICK_BLOCKS) + 1
+MANIFEST_FILE = "features.json"
+SHARD_FILES = {"picks": "-picks.npz", "dense": "-dense.npy", "labels": "-labels.npy", "game_ids": "-game_ids.npy"}
+FEATURE_DTYPE = np.dtype("<f4")
+MATCH_COLUMNS = ["gameId", "teamId", "win"] + BAN_COLUMNS + TRAINING_TEAM_COLUMNS
+PLAYER_COLUMNS = ["gameId", "teamId", "teamPosition", "championId"] + TRAINING_PLAYER_AGGREGATES
+
+
+def feature_layout(champion_slots: int = TRAINING_CHAMPION_SLOTS) -> Dict:
+    blocks = []
+    for side in SIDES:
+        for name in [f"pick_{position}" for position in PICK_BLOCKS] + ["ban"]:
+            blocks.append({"name": f"{side}_{name}", "offset": len(blocks) * champion_slots, "size": champion_slots})
+    dense = [f"{side}_{name}" for side in SIDES for name in TRAINING_PLAYER_AGGREGATES + TRAINING_TEAM_COLUMNS]
+    return {"champion_slots": champion_slots, "sparse_columns": len(blocks) * champion_slots,
+            "sparse_blocks": blocks, "dense_columns": dense, "label": "blue_win"}
+
+
+def save_csr(file_path: str, data: np.ndarray, indices: np.ndarray, indptr: np.ndarray,
+             shape: Tuple[int, int]) -> None:
+    # Same layout as scipy.sparse.save_npz, so scipy.sparse.load_npz reads it
+    # without scipy being needed here.
+    np.savez(file_path, data=data, indices=indices, indptr=indptr, format=np.array(b"csr"),
+             shape=np.array(shape, dtype=np.int64))
+
+
+def load_csr(file_path: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Tuple[int, int]]:
+    with np.load(file_path, allow_pickle=False) as loaded:
+        return loaded["data"], loaded["indices"], loaded["indptr"], tuple(loaded["shape"].tolist())
+
+
+class TrainingExporter:
+    # Turns the tables of each processed chunk into one shard of training
+    # matrices, with numpy only: no Python loop runs per game or player.
+
+    def __init__(self, output_dir: str, basename_prefix: str = "shard",
+                 champion_slots: int = TRAINING_CHAMPION_SLOTS):
+        self.output_dir = output_dir
+        self.basename_prefix = basename_prefix
+        self.champion_slots = champion_slots
+        self.layout = feature_layout(champion_slots)
+        self.shards_written = 0
+        self.rows_written = 0
+        os.makedirs(output_dir, exist_ok=True)
+
+    def write_chunk(self, matches_table: pa.Table, players_table: pa.Table) -> int:
+        game_ids, labels, team_rows = self._games(matches_table)
+        if len(game_ids) == 0:
+            return 0
+
+        picks = self._sparse(game_ids, players_table, team_rows, matches_table)
+        dense = self._dense(game_ids, players_table, matches_table, team_rows)
+        basename = os.path.join(self.output_dir, f"{self.basename_prefix}-{self.shards_written:05d}")
+        save_csr(basename + SHARD_FILES["picks"], *picks)
+        np.save(basename + SHARD_FILES["dense"], dense)
+        np.save(basename + SHARD_FILES["labels"], labels)
+        np.save(basename + SHARD_FILES["game_ids"], game_ids)
+        self.shards_written += 1
+        self.rows_written += len(game_ids)
+        return len(game_ids)
+
+    @staticmethod
+    def _sides(team_ids: np.ndarray) -> np.ndarray:
+        return np.select([team_ids == TEAM_IDS[0], team_ids == TEAM_IDS[1]], [0, 1], -1)
+
+    @staticmethod
+    def _rows(game_ids: np.ndarray, games: np.ndarray) -> np.ndarray:
+        # Row of each game in game_ids (sorted), -1 for games that aren't exported.
+        rows = np.searchsorted(game_ids, games)
+        rows[rows >= len(game_ids)] = 0
+        found = game_ids[rows] == games if len(game_ids) else np.zeros(len(games), dtype=bool)
+        return np.where(found, rows, -1)
+
+    def _games(self, matches_table: pa.Table) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Games with a result for the blue side; returns their sorted IDs, the
+        # labels and the row of every team in the matches table.
+        if matches_table.num_rows == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.int64)
+        games = pc.fill_null(matches_table.column("gameId"), -1).to_numpy()
+        sides = self._sides(pc.fill_null(matches_table.column("teamId"), -1).to_numpy())
+        wins = matches_table.column("win")
+        known = (sides == 0) & pc.is_valid(wins).to_numpy(zero_copy_only=False)
+        game_ids, first = np.unique(games[known], return_index=True)
+        labels = pc.fill_null(wins, False).to_numpy(zero_copy_only=False)[known][first].astype(np.int8)
+        return game_ids, labels, self._rows(game_ids, games)
+
+    def _champion_columns(self, champions: np.ndarray, blocks: np.ndarray) -> np.ndarray:
+        # -1 for missing champions (and "no ban") or IDs beyond the block size.
+        valid = (champions > 0) & (champions < self.champion_slots)
+        return np.where(valid, blocks * self.champion_slots + champions, -1)
+
+    def _sparse(self, game_ids: np.ndarray, players_table: pa.Table, team_rows: np.ndarray,
+                matches_table: pa.Table) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Tuple[int, int]]:
+        rows, columns = [], []
+
+        if players_table.num_rows:
+            player_rows = self._rows(game_ids, pc.fill_null(players_table.column("gameId"), -1).to_numpy())
+            sides = self._sides(pc.fill_null(players_table.column("teamId"), -1).to_numpy())
+            positions = pc.fill_null(pc.index_in(pc.cast(players_table.column("teamPosition"), pa.string()),
+                                                 value_set=pa.array(POSITIONS)), UNKNOWN_POSITION).to_numpy()
+            champions = pc.fill_null(players_table.column("championId"), -1).to_numpy().astype(np.int64)
+            picked = self._champion_columns(champions, sides * BLOCKS_PER_SIDE + positions)
+            keep = (player_rows >= 0) & (sides >= 0) & (picked >= 0)
+            rows.append(player_rows[keep])
+            columns.append(picked[keep])
+
+        team_sides = self._sides(pc.fill_null(matches_table.column("teamId"), -1).to_numpy())
+        for name in BAN_COLUMNS:
+            champions = pc.fill_null(matches_table.column(name), -1).to_numpy().astype(np.int64)
+            banned = self._champion_columns(champions, team_sides * BLOCKS_PER_SIDE + len(PICK_BLOCKS))
+            keep = (team_rows >= 0) & (team_sides >= 0) & (banned >= 0)
+            rows.append(team_rows[keep])
+            columns.append(banned[keep])
+
+        # Sorted, de-duplicated (row, column) keys give the CSR arrays directly.
+        width = self.layout["sparse_columns"]
+        keys = np.unique(np.concatenate(rows) * width + np.concatenate(columns))
+        indices = (keys % width).astype(np.int32)
+        indptr = np.zeros(len(game_ids) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(keys // width, minlength=len(game_ids)), out=indptr[1:])
+        return np.ones(len(keys), dtype=FEATURE_DTYPE), indices, indptr, (len(game_ids), width)
+
+    @staticmethod
+    def _numbers(column) -> np.ndarray:
+        # Booleans become 0/1 and missing values 0.
+        return pc.fill_null(pc.cast(column, pa.float64()), 0.0).to_numpy()
+
+    def _dense(self, game_ids: np.ndarray, players_table: pa.Table, matches_table: pa.Table,
+               team_rows: np.ndarray) -> np.ndarray:
+        per_side = len(TRAINING_PLAYER_AGGREGATES) + len(TRAINING_TEAM_COLUMNS)
+        dense = np.zeros((len(game_ids), len(SIDES), per_side), dtype=np.float64)
+
+        if players_table.num_rows:
+            player_rows = self._rows(game_ids, pc.fill_null(players_table.column("gameId"), -1).to_numpy())
+            sides = self._sides(pc.fill_null(players_table.column("teamId"), -1).to_numpy())
+            keep = (player_rows >= 0) & (sides >= 0)
+            slots = player_rows[keep] * len(SIDES) + sides[keep]
+            for position, name in enumerate(TRAINING_PLAYER_AGGREGATES):
+                values = self._numbers(players_table.column(name))
+                dense[:, :, position] = np.bincount(slots, weights=values[keep],
+                                                    minlength=len(game_ids) * len(SIDES)).reshape(-1, len(SIDES))
+
+        team_sides = self._sides(pc.fill_null(matches_table.column("teamId"), -1).to_numpy())
+        keep = (team_rows >= 0) & (team_sides >= 0)
+        for position, name in enumerate(TRAINING_TEAM_COLUMNS, len(TRAINING_PLAYER_AGGREGATES)):
+            dense[team_rows[keep], team_sides[keep], position] = self._numbers(matches_table.column(name))[keep]
+
+        return dense.reshape(len(game_ids), -1).astype(FEATURE_DTYPE)
+
+
+def shard_names(output_dir: str) -> List[str]:
+    suffix = SHARD_FILES["labels"]
+    return sorted(name[:-len(suffix)] for name in os.listdir(output_dir) if name.endswith(suffix))
+
+
+def remove_shards(output_dir: str, keep: Optional[List[str]] = None) -> int:
+    # Removes every shard file except those of the shards in keep.
+    if not os.path.isdir(output_dir):
+        return 0
+    keep = set(keep or [])
+    removed = 0
+    for name in os.listdir(output_dir):
+        for suffix in SHARD_FILES.values():
+            if name.endswith(suffix) and name[:-len(suffix)] not in keep:
+                os.remove(os.path.join(output_dir, name))
+                removed += 1
+    return removed
+
+
+def prepare_export_dir(output_dir: str, keep_listed: bool = False) -> None:
+    # Incremental runs keep the shards listed in the manifest and drop any an
+    # interrupted run left behind; other runs start from an empty directory.
+    manifest = read_manifest(output_dir) if keep_listed else None
+    keep = [shard["name"] for shard in manifest["shards"]] if manifest else []
+    removed = remove_shards(output_dir, keep)
+    if keep_listed and removed:
+        print(f"Removed {removed} training files left behind by an interrupted run")
+    os.makedirs(output_dir, exist_ok=True)
+
+
+def export_dataset(matches_dir: str, players_dir: str, output_dir: str,
+                   champion_slots: int = TRAINING_CHAMPION_SLOTS) -> int:
+    # Exports every game of the partitioned datasets (each once), one shard per players file.
+    exporter = TrainingExporter(output_dir, "dataset", champion_slots)
+    for matches_table, players_table in iter_dataset_games(matches_dir, players_dir, MATCH_COLUMNS, PLAYER_COLUMNS):
+        exporter.write_chunk(matches_table, players_table)
+    return exporter.rows_written
+
+
+def read_manifest(output_dir: str) -> Optional[Dict]:
+    manifest_file = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file) as f:
+        return json.load(f)
+
+
+def write_manifest(output_dir: str, champion_slots: int = TRAINING_CHAMPION_SLOTS,
+                   runs: Optional[List[str]] = None) -> Dict:
+    # Lists every complete shard with its row count; only the .npy headers are read.
+    # Incremental runs also record the committed runs the shards cover.
+    shards = []
+    for name in shard_names(output_dir):
+        labels = np.load(os.path.join(output_dir, name + SHARD_FILES["labels"]), mmap_mode="r")
+        shards.append({"name": name, "rows": int(labels.shape[0])})
+    manifest = dict(feature_layout(champion_slots), shards=shards, rows=sum(shard["rows"] for shard in shards))
+    if runs is not None:
+        manifest["runs"] = list(runs)
+    temp_file = os.path.join(output_dir, MANIFEST_FILE + ".tmp")
+    with open(temp_file, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_file, os.path.join(output_dir, MANIFEST_FILE))
+    return manifest
+
+
+def iter_shards(output_dir: str, mmap: bool = True) -> Iterator[Dict]:
+    # Yields one shard at a time; the dense matrix, labels and game IDs are
+    # memory-mapped unless mmap is False.
+    manifest = read_manifest(output_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No {MANIFEST_FILE} in {output_dir}")
+    mode = "r" if mmap else None
+    for shard in manifest["shards"]:
+        basename = os.path.join(output_dir, shard["name"])
+        yield {
+            "name": shard["name"],
+            "picks": load_csr(basename + SHARD_FILES["picks"]),
+            "dense": np.load(basename + SHARD_FILES["dense"], mmap_mode=mode),
+            "labels": np.load(basename + SHARD_FILES["labels"], mmap_mode=mode),
+            "game_ids": np.load(basename + SHARD_FILES["game_ids"], mmap_mode=mode),
+        }